@@ -1,28 +1,57 @@
 """FastAPI application exposing chat and scraping endpoints."""
 
-from fastapi import FastAPI, HTTPException, Request
-from typing import Optional
-from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from typing import AsyncIterator, Optional
+from contextlib import aclosing, asynccontextmanager
+from functools import partial
 import asyncio
+import anyio
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.requests import ClientDisconnect
 from fastapi.responses import FileResponse
-from pydantic import BaseModel, ValidationError, model_validator, HttpUrl
+from pydantic import BaseModel, ValidationError, field_validator, model_validator, HttpUrl
 from pathlib import Path
 import httpx
+import json
 import logging
+import re
 import time
 
-from .logging_utils import setup_logging
+from .logging_utils import (
+    current_request_id,
+    current_timings,
+    end_request,
+    request_sampled,
+    setup_logging,
+    start_request,
+    timed,
+    token_logging,
+)
 from .chat_engine import ChatEngine
 from .utils import is_public_url, html_to_text
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from .context import pack_context
+from .filters import citations, infer_filter, is_valid_category, to_chroma
+from .tenants import VectorStoreRegistry, is_valid_city, tenant_exists, tenant_paths
+from .embeddings import get_embeddings
+from .vector_index import SharedIndex, read_generation
+from .sessions import Session, SessionStore, condense_query
+from .batch import iter_jsonl, retrieve_many, run_batch
+from .channel import ChatChannel
+from .cache import LRUCache, normalize_question
+from .recorder import TrafficLog, TrafficRecorder
+from .replay import load_records, top_questions
 from langchain_community.vectorstores import Chroma
 from .config import settings
 
-setup_logging(settings.log_level)
+setup_logging(
+    settings.log_level,
+    fmt=settings.log_format,
+    use_queue=settings.log_queue,
+    sample_rate=settings.log_sample_rate,
+    token_sample_rate=settings.log_token_sample_rate,
+)
 logger = logging.getLogger(__name__)
 
 WEB_DIR = Path(__file__).parent.parent / "web"
@@ -32,22 +61,34 @@ __all__ = [
     "create_app",
     "ChatRequest",
     "ChatResponse",
+    "Citation",
+    "SessionResponse",
+    "BatchRequest",
     "ScrapeRequest",
     "ScrapeResponse",
 ]
 
 
-def load_vectordb(db_dir: Path) -> Chroma | None:
-    """Load a Chroma database from ``db_dir`` if present."""
+def load_vectordb(db_dir: Path) -> Chroma | SharedIndex | None:
+    """Load a Chroma database from ``db_dir`` if present.
+
+    With ``SHARED_INDEX`` enabled the memory-mapped export of the current
+    ingest generation is preferred so worker processes share one copy.
+    """
     if not db_dir.exists():
         return None
     try:
-        try:
-            embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-        except Exception:
-            model_dir = Path(__file__).parent.parent / "models" / "bge-small-en"
-            name = str(model_dir) if model_dir.exists() else "BAAI/bge-small-en"
-            embeddings = HuggingFaceEmbeddings(model_name=name)
+        embeddings = get_embeddings()
+        if settings.shared_index:
+            index = SharedIndex.load(
+                db_dir,
+                embeddings,
+                dtype=settings.index_dtype,
+                rerank=settings.index_rerank,
+            )
+            if index is not None:
+                return index
+            logger.info("No shared index in %s, using Chroma", db_dir)
         db = Chroma(persist_directory=str(db_dir), embedding_function=embeddings)
         logger.info("Loaded vector DB from %s", db_dir)
         return db
@@ -56,17 +97,81 @@ def load_vectordb(db_dir: Path) -> Chroma | None:
         return None
 
 
-def build_prompt(message: str, vectordb: Chroma | None) -> str:
-    """Return a prompt with optional vector search context."""
-    prompt = message
-    if vectordb:
-        try:
-            docs = vectordb.similarity_search(message, k=3)
-            context = "\n\n".join(d.page_content for d in docs)
-            prompt = f"Context:\n{context}\n\nUser: {message}\nAssistant:"
-        except Exception:
-            logger.exception("Vector search failed")
-    return prompt
+def close_vectordb(db: Chroma | SharedIndex) -> None:
+    """Release the database ``load_vectordb`` opened for a store being dropped.
+
+    chromadb keeps one system (sqlite connection and loaded HNSW segments)
+    per persist directory for the life of the process, so it is stopped and
+    removed from chromadb's cache; the memory-mapped ``SharedIndex`` is
+    simply left to the garbage collector.
+    """
+    if isinstance(db, Chroma):
+        _release_chroma_system(db._persist_directory)
+
+
+def _release_chroma_system(persist_directory: str | None) -> None:
+    from chromadb.api.client import SharedSystemClient
+
+    system = SharedSystemClient._identifer_to_system.pop(persist_directory, None)
+    if system is not None:
+        system.stop()
+
+
+def retrieve(
+    vectordb: Chroma | None, query: str, where: dict | None = None
+) -> list | None:
+    """Return ``settings.context_candidates`` chunks similar to ``query``.
+
+    ``where`` restricts the search to chunks whose metadata match, such as
+    ``{"category": "trash"}``; if nothing matches, for example in a store
+    ingested before chunks carried metadata, the whole store is searched.
+    Returns ``None`` without a vector store or when the search fails.
+    """
+    if not vectordb:
+        return None
+    try:
+        if where:
+            docs = vectordb.similarity_search(
+                query, k=settings.context_candidates, filter=to_chroma(where)
+            )
+            if docs:
+                return docs
+        return vectordb.similarity_search(query, k=settings.context_candidates)
+    except Exception:
+        logger.exception("Vector search failed")
+        return None
+
+
+def build_prompt(
+    message: str,
+    vectordb: Chroma | None,
+    history: str = "",
+    query: str | None = None,
+    where: dict | None = None,
+) -> str:
+    """Return a prompt with optional vector search context.
+
+    ``settings.context_candidates`` chunks are retrieved, overlapping and
+    near-duplicate chunks are merged away and the remainder is packed into
+    ``settings.context_token_budget`` estimated tokens. ``query`` overrides
+    the text used for retrieval, ``where`` filters it by metadata and
+    ``history`` adds earlier conversation turns to the prompt.
+    """
+    docs = retrieve(vectordb, query or message, where)
+    return compose_prompt(message, docs, history)
+
+
+def compose_prompt(message: str, docs: list | None, history: str = "") -> str:
+    """Return the LLM prompt for ``message`` given already retrieved ``docs``."""
+    sections = []
+    if docs is not None:
+        context = pack_context(docs, settings.context_token_budget)
+        sections.append(f"Context:\n{context}")
+    if history:
+        sections.append(f"Conversation so far:\n{history}")
+    if not sections:
+        return message
+    return "\n\n".join(sections) + f"\n\nUser: {message}\nAssistant:"
 
 
 @asynccontextmanager
@@ -77,20 +182,114 @@ async def lifespan(app: FastAPI):
         model=settings.openai_model,
         ollama_model=settings.ollama_model,
         fallback_message=settings.fallback_message,
+        max_concurrency=settings.llm_concurrency,
     )
-    app.state.vectordb = load_vectordb(settings.vector_db_dir)
+    app.state.stores.get(None)
+    if settings.warmup_file and settings.warmup_questions:
+        # Warm up before accepting traffic so real users never queue
+        # behind warm-up questions for the LLM.
+        try:
+            records = await asyncio.to_thread(
+                load_records, [Path(settings.warmup_file)]
+            )
+        except OSError as exc:
+            logger.warning("Cache warm-up skipped: %s", exc)
+        else:
+            await warm_caches(app, top_questions(records, settings.warmup_questions))
     try:
         yield
     finally:
+        if app.state.recorder is not None:
+            await asyncio.to_thread(app.state.recorder.close)
         try:
             await asyncio.to_thread(app.state.engine.close)
         except Exception:
             logger.warning("Engine cleanup failed", exc_info=True)
 
 
+class RequestLogMiddleware:
+    """Log the method, path, status code and duration of each HTTP request.
+
+    Implemented as plain ASGI middleware rather than ``@app.middleware`` so
+    it does not re-wrap responses, which would consume streamed request
+    bodies that ``/chat_batch`` reads while responding.
+
+    Each request gets an id, taken from a valid ``X-Request-ID`` header or
+    generated, which is returned in the response and attached to every
+    record logged while handling it together with the stage timings.
+    """
+
+    _REQUEST_ID_RE = re.compile(r"^[\w.\-]{1,64}$")
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.monotonic()
+        status = 500
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if self._REQUEST_ID_RE.match(candidate):
+                    request_id = candidate
+                break
+        token = start_request(request_id)
+        header = (b"x-request-id", current_request_id().encode("latin-1"))
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", ()), header]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = (time.monotonic() - start) * 1000.0
+            if request_sampled() and logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "%s %s %s %.2fms",
+                    scope["method"],
+                    scope["path"],
+                    status,
+                    duration,
+                    extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status": status,
+                        "duration_ms": round(duration, 3),
+                        "timings": current_timings(),
+                    },
+                )
+            end_request(token)
+
+
 def create_app() -> FastAPI:
     """Return a fully configured FastAPI application."""
     app = FastAPI(lifespan=lifespan)
+    app.state.sessions = SessionStore(
+        ttl=settings.session_ttl,
+        max_sessions=settings.max_sessions,
+        max_turns=settings.session_max_turns,
+        summary_tokens=settings.session_summary_tokens,
+    )
+    app.state.stores = VectorStoreRegistry(
+        lambda city: load_vectordb(tenant_paths(city)[1]),
+        max_stores=settings.max_loaded_cities,
+        version=lambda city: read_generation(tenant_paths(city)[1]),
+        check_interval=settings.index_check_interval,
+        unload=close_vectordb,
+    )
+    app.state.responses = None
+    if settings.response_cache_size:
+        app.state.responses = LRUCache(
+            settings.response_cache_size, ttl=settings.response_cache_ttl
+        )
     app.add_middleware(
         CORSMiddleware,
         allow_origins=settings.allowed_origins,
@@ -98,19 +297,15 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
-    @app.middleware("http")
-    async def log_requests(request: Request, call_next):
-        start = time.monotonic()
-        response = await call_next(request)
-        duration = (time.monotonic() - start) * 1000.0
-        logger.info(
-            "%s %s %s %.2fms",
-            request.method,
-            request.url.path,
-            response.status_code,
-            duration,
+    app.add_middleware(RequestLogMiddleware)
+    app.state.recorder = None
+    if settings.traffic_log:
+        app.state.recorder = TrafficLog(
+            Path(settings.traffic_log),
+            max_bytes=settings.traffic_log_max_bytes,
+            backups=settings.traffic_log_backups,
         )
-        return response
+        app.add_middleware(TrafficRecorder, log=app.state.recorder)
     # Serve static files under /static and return index.html at the root
     app.mount("/static", StaticFiles(directory=WEB_DIR), name="static")
 
@@ -125,8 +320,89 @@ def create_app() -> FastAPI:
 app = create_app()
 
 
+async def get_vectordb(app: FastAPI, city: str | None) -> Chroma | None:
+    """Return the vector store for ``city``, loading it off the event loop.
+
+    Raises a 404 ``HTTPException`` for a city that has not been ingested,
+    so typos neither take a registry slot nor get answered without context.
+    """
+    stores: VectorStoreRegistry = app.state.stores
+    found, store = stores.try_get(city)
+    if found:
+        return store
+    if not tenant_exists(city):
+        raise HTTPException(status_code=404, detail="unknown city")
+    return await asyncio.to_thread(stores.get, city)
+
+
+def search_filter(req: "ChatRequest", query: str) -> dict | None:
+    """Return the metadata filter for a chat request.
+
+    A ``category`` sent by the client wins; otherwise one is inferred from
+    the question when ``settings.infer_filters`` is enabled.
+    """
+    if req.category:
+        return {"category": req.category}
+    if settings.infer_filters:
+        return infer_filter(query)
+    return None
+
+
+def get_session(request: Request, session_id: str | None) -> Session | None:
+    """Return the conversation for ``session_id`` or raise 404 if it expired."""
+    if session_id is None:
+        return None
+    session = request.app.state.sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="unknown session")
+    return session
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """Streaming response for endpoints that keep reading the request body.
+
+    ``StreamingResponse`` listens for client disconnects by consuming
+    ``receive`` messages, which would swallow a request body that is still
+    being streamed. Here the endpoint owns ``receive`` until it sets
+    ``body_done``; from then on the response listens for the disconnect
+    itself and stops streaming, cancelling the work behind it.
+    """
+
+    def __init__(self, content, body_done: asyncio.Event, **kwargs) -> None:
+        super().__init__(content, **kwargs)
+        self.body_done = body_done
+
+    async def __call__(self, scope, receive, send) -> None:
+        async with anyio.create_task_group() as task_group:
+
+            async def wrap(func) -> None:
+                await func()
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(wrap, partial(self.stream_response, send))
+            await self.body_done.wait()
+            await wrap(partial(self.listen_for_disconnect, receive))
+
+
 class ChatRequest(BaseModel):
     message: str
+    city: Optional[str] = None
+    session_id: Optional[str] = None
+    category: Optional[str] = None
+
+    @field_validator("city")
+    @classmethod
+    def _check_city(cls, v: Optional[str]) -> Optional[str]:
+        if v is not None and not is_valid_city(v):
+            raise ValueError("invalid city")
+        return v
+
+    @field_validator("category")
+    @classmethod
+    def _check_category(cls, v: Optional[str]) -> Optional[str]:
+        if v is not None and not is_valid_category(v):
+            raise ValueError("invalid category")
+        return v
 
     @model_validator(mode="after")
     def _check_length(cls, values: "ChatRequest") -> "ChatRequest":
@@ -135,8 +411,27 @@ class ChatRequest(BaseModel):
         return values
 
 
+class Citation(BaseModel):
+    source: str
+    section: str = ""
+    category: str = ""
+    date: str = ""
+
+
 class ChatResponse(BaseModel):
     response: str
+    session_id: Optional[str] = None
+    citations: list[Citation] = []
+
+
+class SessionResponse(BaseModel):
+    session_id: str
+
+
+class BatchRequest(BaseModel):
+    """JSON body for ``/chat_batch``; JSONL bodies carry one item per line."""
+
+    items: list[dict]
 
 
 class ScrapeRequest(BaseModel):
@@ -200,53 +495,380 @@ async def scrape(payload: ScrapeRequest):
         raise HTTPException(status_code=400, detail=str(exc))
 
 
+@app.post("/sessions", response_model=SessionResponse)
+async def create_session(request: Request):
+    """Start a conversation whose history is kept on the server."""
+    return {"session_id": request.app.state.sessions.create()}
+
+
+def response_key(app: FastAPI, req: ChatRequest, where: dict | None) -> tuple:
+    """Return the response cache key of a question asked outside a session.
+
+    The key includes the city's ingest generation, as last checked by the
+    store registry (every ``INDEX_CHECK_INTERVAL`` seconds), so every worker
+    stops serving cached answers once any of them has re-ingested the city.
+    """
+    generation = app.state.stores.current_version(req.city)
+    return (
+        req.city,
+        generation,
+        json.dumps(where, sort_keys=True),
+        normalize_question(req.message),
+    )
+
+
+async def answer(
+    app: FastAPI, req: ChatRequest, session: Session | None = None
+) -> tuple[str, list[dict]]:
+    """Return the reply to ``req`` and the citations of its context.
+
+    Questions asked outside a session are served from, and stored in, the
+    response cache when ``RESPONSE_CACHE_SIZE`` is set.
+    """
+    query = condense_query(session, req.message)
+    where = search_filter(req, query)
+    cache: LRUCache | None = app.state.responses
+    key = None
+    if cache is not None and session is None:
+        key = response_key(app, req, where)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    with timed("retrieve"):
+        vectordb = await get_vectordb(app, req.city)
+        docs = retrieve(vectordb, query, where)
+        prompt = compose_prompt(
+            req.message, docs, history=session.history() if session else ""
+        )
+    engine: ChatEngine = app.state.engine
+    with timed("generate"):
+        reply = await engine.generate_async(prompt, timeout=30.0)
+    result = (reply, citations(docs))
+    if key is not None and reply and reply != settings.fallback_message:
+        cache.put(key, result)
+    return result
+
+
+async def warm_caches(app: FastAPI, questions: list[dict]) -> int:
+    """Prepare the caches for ``questions`` ahead of traffic.
+
+    Each question is embedded and searched, which loads its city's store
+    and fills the embedding cache; nothing is done unless
+    ``EMBEDDING_CACHE_SIZE`` keeps the embeddings. Only with
+    ``WARMUP_ANSWERS`` and a response cache are the questions answered too,
+    which costs one LLM call per question in every worker. Returns the
+    number of questions warmed.
+    """
+    requests = []
+    for question in questions:
+        try:
+            requests.append(
+                ChatRequest.model_validate(
+                    {k: question[k] for k in ("message", "city", "category") if k in question}
+                )
+            )
+        except ValidationError:
+            continue
+    warmed = 0
+    answers = app.state.responses is not None and settings.warmup_answers
+    if not answers and settings.embedding_cache_size <= 0:
+        logger.info("Cache warm-up skipped: no embedding cache and WARMUP_ANSWERS off")
+        return 0
+    if answers:
+        for req in requests:
+            try:
+                await answer(app, req)
+                warmed += 1
+            except Exception:
+                logger.warning("Warm-up failed for %r", req.message, exc_info=True)
+    else:
+        by_city: dict[str | None, list[ChatRequest]] = {}
+        for req in requests:
+            by_city.setdefault(req.city, []).append(req)
+        for city, group in by_city.items():
+            messages = [r.message for r in group]
+            try:
+                vectordb = await get_vectordb(app, city)
+                if vectordb is None:
+                    await asyncio.to_thread(get_embeddings().embed_documents, messages)
+                else:
+                    await asyncio.to_thread(
+                        retrieve_many,
+                        vectordb,
+                        messages,
+                        settings.context_candidates,
+                        [search_filter(r, r.message) for r in group],
+                    )
+                warmed += len(group)
+            except Exception:
+                logger.warning("Warm-up failed for %s", city or "default", exc_info=True)
+    logger.info("Warmed caches with %d of %d questions", warmed, len(questions))
+    return warmed
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(req: ChatRequest, request: Request):
     """Return a response from the LLM with optional vector search context."""
     logger.debug("POST /chat called with: %s", req.message)
+    session = get_session(request, req.session_id)
     try:
-        vectordb: Chroma | None = request.app.state.vectordb
-        prompt = build_prompt(req.message, vectordb)
-        engine: ChatEngine = request.app.state.engine
-        reply = await engine.generate_async(prompt, timeout=30.0)
+        reply, cited = await answer(request.app, req, session)
         logger.debug("POST /chat response: %s", reply)
-        return {"response": reply}
+        if session is not None:
+            sessions: SessionStore = request.app.state.sessions
+            sessions.append(session, True, req.message)
+            sessions.append(session, False, reply)
+        return {"response": reply, "session_id": req.session_id, "citations": cited}
+    except HTTPException:
+        raise
     except Exception as exc:
         logger.exception("Chat endpoint failed: %s", exc)
         raise HTTPException(status_code=500, detail="chat failed")
 
 
+async def open_stream(
+    app: FastAPI, req: ChatRequest, session: Session | None = None
+) -> tuple[list[dict], AsyncIterator[str]]:
+    """Retrieve context for ``req`` and return its citations and token stream.
+
+    Answers in the response cache are streamed as a single token. The
+    exchange is added to ``session`` once the stream has been consumed.
+    """
+    query = condense_query(session, req.message)
+    where = search_filter(req, query)
+    cached = None
+    cache: LRUCache | None = app.state.responses
+    if cache is not None and session is None:
+        cached = cache.get(response_key(app, req, where))
+    if cached is not None:
+        cited = cached[1]
+    else:
+        with timed("retrieve"):
+            vectordb = await get_vectordb(app, req.city)
+            docs = retrieve(vectordb, query, where)
+            prompt = compose_prompt(
+                req.message, docs, history=session.history() if session else ""
+            )
+        cited = citations(docs)
+
+    async def tokens():
+        log_tokens = token_logging(logger)
+        parts = []
+        with timed("generate"):
+            if cached is not None:
+                parts.append(cached[0])
+                yield cached[0]
+            else:
+                engine: ChatEngine = app.state.engine
+                # Close the engine stream (and free its slot) as soon as the
+                # consumer stops, not when the generator is collected.
+                async with aclosing(engine.stream_async(prompt, timeout=30.0)) as stream:
+                    async for token in stream:
+                        if log_tokens:
+                            logger.debug("stream token: %s", token)
+                        parts.append(token)
+                        yield token
+        if session is not None:
+            sessions: SessionStore = app.state.sessions
+            sessions.append(session, True, req.message)
+            sessions.append(session, False, "".join(parts))
+
+    return cited, tokens()
+
+
 @app.post("/chat_stream")
 async def chat_stream(req: ChatRequest, request: Request):
-    """Stream the LLM response token by token."""
+    """Stream the LLM response token by token.
+
+    Clients accepting ``application/x-ndjson`` receive JSON lines instead of
+    plain text: a ``{"type": "citations"}`` frame listing the retrieved
+    sources before generation starts, one ``{"type": "token"}`` frame per
+    token and a final ``{"type": "done"}`` frame. Answers in the response
+    cache are sent as a single token.
+    """
     logger.debug("POST /chat_stream called with: %s", req.message)
+    session = get_session(request, req.session_id)
     try:
-        vectordb: Chroma | None = request.app.state.vectordb
-        prompt = build_prompt(req.message, vectordb)
-
-        async def token_gen():
-            engine: ChatEngine = request.app.state.engine
-            async for token in engine.stream_async(prompt, timeout=30.0):
-                logger.debug("stream token: %s", token)
-                yield token
-
-        return StreamingResponse(token_gen(), media_type="text/plain; charset=utf-8")
+        cited, tokens = await open_stream(request.app, req, session)
+    except HTTPException:
+        raise
     except Exception as exc:
         logger.exception("chat_stream failed: %s", exc)
         raise HTTPException(status_code=500, detail="chat_stream failed")
+    if "application/x-ndjson" not in request.headers.get("accept", ""):
+        return StreamingResponse(tokens, media_type="text/plain; charset=utf-8")
+
+    async def frames():
+        yield json.dumps({"type": "citations", "citations": cited}) + "\n"
+        async for token in tokens:
+            yield json.dumps({"type": "token", "text": token}) + "\n"
+        yield '{"type": "done"}\n'
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+
+@app.websocket("/ws")
+async def chat_ws(websocket: WebSocket):
+    """Serve many concurrent chat streams over one WebSocket.
+
+    See ``api.channel`` for the frame format. Connections from origins not
+    in ``CORS_ORIGINS`` are refused.
+    """
+    origin = websocket.headers.get("origin")
+    allowed = settings.allowed_origins
+    if origin and "*" not in allowed and origin not in allowed:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    app = websocket.app
+
+    async def start(frame: dict) -> tuple[list[dict], AsyncIterator[str]]:
+        fields = {k: v for k, v in frame.items() if k not in ("type", "id")}
+        try:
+            req = ChatRequest.model_validate(fields)
+        except ValidationError as exc:
+            raise ValueError(exc.errors()[0]["msg"])
+        session = None
+        if req.session_id is not None:
+            session = app.state.sessions.get(req.session_id)
+            if session is None:
+                raise ValueError("unknown session")
+        try:
+            return await open_stream(app, req, session)
+        except HTTPException as exc:
+            raise ValueError(exc.detail)
+
+    channel = ChatChannel(
+        websocket.send_text,
+        websocket.receive_text,
+        start,
+        max_streams=settings.ws_max_streams,
+        queue_size=settings.ws_send_queue,
+        coalesce=settings.ws_coalesce_ms / 1000.0,
+        send_timeout=settings.ws_send_timeout,
+        close=websocket.close,
+    )
+    try:
+        await channel.run()
+    except WebSocketDisconnect:
+        pass
+
+
+@app.post("/chat_batch")
+async def chat_batch(request: Request):
+    """Answer many questions and stream JSONL results as they complete.
+
+    The body is either ``{"items": [...]}`` or, with an
+    ``application/x-ndjson`` content type, a stream of JSON lines. Each item
+    needs a ``message`` and may carry an ``id`` and ``city``; results are
+    ``{"id", "response"}`` or ``{"id", "error"}`` objects. Batch answers are
+    independent, so items carrying a ``session_id`` are rejected.
+    """
+    logger.debug("POST /chat_batch called")
+    body_done = None
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        body_done = asyncio.Event()
+
+        async def body():
+            while True:
+                message = await request.receive()
+                if message["type"] == "http.disconnect":
+                    raise ClientDisconnect()
+                if not message.get("more_body", False):
+                    # Hand ``receive`` to the response before the last chunk is parsed.
+                    body_done.set()
+                    yield message.get("body", b"")
+                    return
+                yield message.get("body", b"")
+
+        items = iter_jsonl(body())
+    else:
+        try:
+            payload = BatchRequest.model_validate(await request.json())
+        except (ValueError, ValidationError) as exc:
+            raise HTTPException(status_code=422, detail=str(exc))
+
+        async def listed():
+            for index, item in enumerate(payload.items):
+                item.setdefault("id", index)
+                yield item
+
+        items = listed()
+
+    async def prepare(group: list[dict]) -> list:
+        prompts: list = [None] * len(group)
+        by_city: dict[str | None, list[int]] = {}
+        wheres: list = [None] * len(group)
+        for i, item in enumerate(group):
+            try:
+                req = ChatRequest.model_validate(item)
+            except ValidationError as exc:
+                prompts[i] = ValueError(exc.errors()[0]["msg"])
+                continue
+            if req.session_id is not None:
+                prompts[i] = ValueError("session_id is not supported in batches")
+                continue
+            group[i] = {**item, "message": req.message}
+            wheres[i] = search_filter(req, req.message)
+            by_city.setdefault(req.city, []).append(i)
+        for city, indexes in by_city.items():
+            if not tenant_exists(city):
+                for i in indexes:
+                    prompts[i] = ValueError("unknown city")
+                continue
+            messages = [group[i]["message"] for i in indexes]
+            vectordb = await get_vectordb(request.app, city)
+            results: list = [None] * len(indexes)
+            if vectordb is not None:
+                try:
+                    results = await asyncio.to_thread(
+                        retrieve_many,
+                        vectordb,
+                        messages,
+                        settings.context_candidates,
+                        [wheres[i] for i in indexes],
+                    )
+                except Exception:
+                    logger.exception("Batch vector search failed")
+            for i, message, docs in zip(indexes, messages, results):
+                prompts[i] = compose_prompt(message, docs)
+        return prompts
+
+    engine: ChatEngine = request.app.state.engine
+
+    async def lines():
+        async for result in run_batch(
+            items,
+            prepare,
+            lambda prompt: engine.generate_async(prompt, timeout=30.0),
+            batch_size=settings.batch_size,
+            concurrency=settings.batch_concurrency,
+        ):
+            yield json.dumps(result) + "\n"
+
+    if body_done is None:
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    return DuplexStreamingResponse(lines(), body_done, media_type="application/x-ndjson")
 
 
 @app.post("/ingest")
-async def ingest_endpoint(request: Request) -> dict[str, str]:
-    """Trigger data ingestion without blocking the event loop."""
-    logger.debug("POST /ingest called")
+async def ingest_endpoint(request: Request, city: Optional[str] = None) -> dict:
+    """Trigger data ingestion for one city without blocking the event loop."""
+    logger.debug("POST /ingest called for city %s", city)
+    if city is not None and not is_valid_city(city):
+        raise HTTPException(status_code=422, detail="invalid city")
     try:
         from data.ingest import main as ingest_main
 
-        await asyncio.to_thread(
-            ingest_main, settings.data_dir, settings.vector_db_dir
-        )
-        request.app.state.vectordb = load_vectordb(settings.vector_db_dir)
+        data_dir, db_dir = tenant_paths(city)
+        kwargs = {"city": city} if city else {}
+        report = await asyncio.to_thread(ingest_main, data_dir, db_dir, **kwargs)
+        request.app.state.stores.evict(city)
+        await asyncio.to_thread(request.app.state.stores.get, city)
+        if request.app.state.responses is not None:
+            request.app.state.responses.clear()
+        if isinstance(report, dict):
+            return {"status": "completed", "report": report}
         return {"status": "completed"}
     except Exception as exc:
         logger.exception("ingest failed: %s", exc)
@@ -0,0 +1,219 @@
+"""Batch question answering for bulk backfills.
+
+The ``/chat_batch`` endpoint accepts many questions, either as a JSON list
+or as a streamed JSONL body, and streams JSONL results back as they
+complete. Questions are embedded and retrieved in groups and answers are
+generated with bounded concurrency; a failing item yields an ``error``
+result instead of aborting the batch.
+
+The module also provides a CLI that streams a JSONL file to a running
+server::
+
+    python -m api.batch questions.jsonl --url http://localhost:5000 -o answers.jsonl
+"""
+
+from __future__ import annotations
+
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterator
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+from .filters import to_chroma
+
+__all__ = ["iter_jsonl", "retrieve_many", "run_batch"]
+
+logger = logging.getLogger(__name__)
+
+Prepare = Callable[[list[dict[str, Any]]], Awaitable[list[Any]]]
+Generate = Callable[[str], Awaitable[str]]
+
+
+async def iter_jsonl(chunks: AsyncIterable[bytes]) -> AsyncIterator[dict[str, Any]]:
+    """Yield one item per non-empty JSONL line of a streamed body.
+
+    Lines that are not JSON objects yield ``{"id", "parse_error"}`` so the
+    caller can report them without stopping; the dedicated key keeps them
+    apart from valid items that happen to carry an ``error`` field.
+    """
+    buffer = b""
+    index = 0
+
+    def parse(line: bytes) -> dict[str, Any]:
+        try:
+            item = json.loads(line)
+        except ValueError:
+            return {"id": index, "parse_error": "invalid JSON"}
+        if not isinstance(item, dict):
+            return {"id": index, "parse_error": "expected a JSON object"}
+        item.setdefault("id", index)
+        return item
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield parse(line)
+                index += 1
+    if buffer.strip():
+        yield parse(buffer)
+
+
+def _search_vectors(vectordb, vectors: list, k: int, where: dict | None) -> list[list]:
+    kwargs = {"filter": to_chroma(where)} if where else {}
+    if hasattr(vectordb, "similarity_search_by_vectors"):
+        return vectordb.similarity_search_by_vectors(vectors, k=k, **kwargs)
+    return [vectordb.similarity_search_by_vector(v, k=k, **kwargs) for v in vectors]
+
+
+def retrieve_many(
+    vectordb, queries: list[str], k: int, wheres: list[dict | None] | None = None
+) -> list[list]:
+    """Return the top ``k`` documents for each query using one embedding call.
+
+    ``wheres`` gives an optional metadata filter per query. Queries sharing
+    a filter are searched together, and filtered queries without results
+    are searched again unfiltered.
+    """
+    vectors = vectordb.embeddings.embed_documents(queries)
+    wheres = wheres or [None] * len(queries)
+    groups: dict[str, list[int]] = {}
+    for i, where in enumerate(wheres):
+        groups.setdefault(json.dumps(where, sort_keys=True), []).append(i)
+    results: list[list] = [[] for _ in queries]
+    retry: list[int] = []
+    for indexes in groups.values():
+        where = wheres[indexes[0]]
+        found = _search_vectors(vectordb, [vectors[i] for i in indexes], k, where)
+        for i, docs in zip(indexes, found):
+            results[i] = docs
+            if where and not docs:
+                retry.append(i)
+    if retry:
+        found = _search_vectors(vectordb, [vectors[i] for i in retry], k, None)
+        for i, docs in zip(retry, found):
+            results[i] = docs
+    return results
+
+
+async def run_batch(
+    items: AsyncIterable[dict[str, Any]],
+    prepare: Prepare,
+    generate: Generate,
+    batch_size: int = 32,
+    concurrency: int = 4,
+) -> AsyncIterator[dict[str, Any]]:
+    """Answer ``items`` and yield results in completion order.
+
+    ``prepare`` turns a group of up to ``batch_size`` items into one prompt
+    per item (or an ``Exception`` for items that cannot be answered) so
+    retrieval can be vectorized. ``generate`` produces the answer for one
+    prompt; at most ``concurrency`` generations run at a time and results
+    are handed over through a bounded queue, so a slow reader throttles the
+    batch instead of buffering it in memory.
+    """
+    results: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue(concurrency * 2)
+    slots = asyncio.Semaphore(concurrency)
+    tasks: set[asyncio.Task] = set()
+
+    async def answer(item_id: Any, prompt: str) -> None:
+        try:
+            try:
+                out = {"id": item_id, "response": await generate(prompt)}
+            except Exception as exc:
+                logger.warning("Batch item %s failed: %s", item_id, exc)
+                out = {"id": item_id, "error": "generation failed"}
+            await results.put(out)
+        finally:
+            slots.release()
+
+    async def flush(group: list[dict[str, Any]]) -> None:
+        try:
+            prompts = await prepare(group)
+        except Exception as exc:
+            logger.warning("Batch retrieval failed: %s", exc)
+            prompts = [exc] * len(group)
+        for item, prompt in zip(group, prompts):
+            if isinstance(prompt, Exception):
+                await results.put({"id": item["id"], "error": str(prompt)})
+                continue
+            await slots.acquire()
+            task = asyncio.create_task(answer(item["id"], prompt))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    async def produce() -> None:
+        try:
+            group: list[dict[str, Any]] = []
+            async for item in items:
+                if "parse_error" in item:
+                    await results.put({"id": item.get("id"), "error": item["parse_error"]})
+                    continue
+                group.append(item)
+                if len(group) >= batch_size:
+                    await flush(group)
+                    group = []
+            if group:
+                await flush(group)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except Exception as exc:
+            logger.exception("Batch input failed: %s", exc)
+            await results.put({"id": None, "error": "batch input failed"})
+        finally:
+            await results.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            yield result
+    finally:
+        producer.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+
+def _read_lines(path: str) -> Iterator[bytes]:
+    stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+    with stream:
+        for line in stream:
+            yield line
+
+
+def _cli() -> None:
+    import httpx
+
+    parser = argparse.ArgumentParser(
+        description="Answer a JSONL file of questions with /chat_batch"
+    )
+    parser.add_argument(
+        "input", help="JSONL file with one {\"message\": ...} per line, or -"
+    )
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output file")
+    args = parser.parse_args()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    with out, httpx.Client(timeout=None) as client:
+        with client.stream(
+            "POST",
+            f"{args.url.rstrip('/')}/chat_batch",
+            content=_read_lines(args.input),
+            headers={"Content-Type": "application/x-ndjson"},
+        ) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if line:
+                    out.write(line + "\n")
+                    out.flush()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    _cli()
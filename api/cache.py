@@ -0,0 +1,99 @@
+"""Small in-process caches for answers and query embeddings.
+
+Both caches are disabled unless their size is configured
+(``RESPONSE_CACHE_SIZE``, ``EMBEDDING_CACHE_SIZE``) and can be pre-filled
+on startup from recorded traffic with ``WARMUP_FILE``.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Hashable
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
+
+__all__ = ["LRUCache", "CachedEmbeddings", "normalize_question"]
+
+
+def normalize_question(text: str) -> str:
+    """Return ``text`` lowercased with runs of whitespace collapsed."""
+    return " ".join(text.lower().split())
+
+
+class LRUCache:
+    """Thread-safe mapping that keeps the ``max_items`` most recently used keys.
+
+    Entries older than ``ttl`` seconds are treated as missing; ``ttl`` of
+    ``0`` keeps entries until they are evicted.
+    """
+
+    def __init__(self, max_items: int, ttl: float = 0.0) -> None:
+        self.max_items = max_items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self._items[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._items[key] = (time.monotonic(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap an embedding model and remember the vectors of recent texts.
+
+    Repeated questions skip the embedding call, which is a network round
+    trip for OpenAI or the embedding server.
+    """
+
+    def __init__(self, inner: Embeddings, max_items: int) -> None:
+        self.inner = inner
+        self.cache = LRUCache(max_items)
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self.cache.get(text)
+        if vector is None:
+            vector = self.inner.embed_query(text)
+            self.cache.put(text, vector)
+        return vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors = [self.cache.get(text) for text in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            computed = self.inner.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+                self.cache.put(texts[i], vector)
+        return vectors
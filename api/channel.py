@@ -0,0 +1,223 @@
+"""Multiplexed chat streams over a single WebSocket connection.
+
+Clients send JSON frames tagged with an ``id`` they choose::
+
+    {"type": "chat", "id": "m1", "message": "When is trash pickup?"}
+    {"type": "cancel", "id": "m1"}
+
+and receive frames tagged with the same ``id``::
+
+    {"type": "citations", "id": "m1", "citations": [...]}
+    {"type": "token", "id": "m1", "text": "Residential trash is"}
+    {"type": "done", "id": "m1"}
+
+``error`` and ``cancelled`` frames end a stream early. Outgoing frames pass
+through one bounded queue: when the client reads slowly the queue fills
+and the streams producing tokens wait, which in turn stops reading from
+the LLM. Every frame, including errors, must be queued and written within
+``send_timeout`` seconds; otherwise the client is not reading, its streams
+are stopped and the socket is closed with code ``1008``, so it cannot hold
+an LLM slot other requests are waiting for. Token frames waiting in the
+queue are merged per ``id`` before they are sent, so a slow client
+receives fewer, larger frames.
+"""
+
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Awaitable, Callable
+import asyncio
+import json
+import logging
+
+__all__ = ["ChatChannel", "coalesce_frames"]
+
+logger = logging.getLogger(__name__)
+
+# ``open_stream(frame)`` returns the citations and the tokens of one answer.
+OpenStream = Callable[[dict[str, Any]], Awaitable[tuple[list, AsyncIterator[str]]]]
+
+# Close code sent to a client that stopped reading.
+CLOSE_NOT_READING = 1008
+
+
+class _Stalled(Exception):
+    """The client did not take a frame within ``send_timeout``."""
+
+
+def coalesce_frames(frames: list[dict]) -> list[dict]:
+    """Merge token frames per ``id`` while keeping each stream's frame order."""
+    pending: dict[Any, dict] = {}
+    result: list[dict] = []
+    for frame in frames:
+        if frame["type"] == "token":
+            merged = pending.get(frame["id"])
+            if merged is None:
+                pending[frame["id"]] = dict(frame)
+            else:
+                merged["text"] += frame["text"]
+            continue
+        earlier = pending.pop(frame.get("id"), None)
+        if earlier is not None:
+            result.append(earlier)
+        result.append(frame)
+    result.extend(pending.values())
+    return result
+
+
+class ChatChannel:
+    """Serve concurrent chat streams for one WebSocket.
+
+    ``send_text``, ``receive_text`` and ``close`` are the socket's methods
+    and ``open_stream`` starts an answer for a ``chat`` frame. At most
+    ``max_streams`` answers run at once, ``queue_size`` frames wait to be
+    sent and the writer waits ``coalesce`` seconds after the first frame of
+    a batch so tokens arriving meanwhile share a frame. When a frame waits
+    longer than ``send_timeout`` seconds for room in the queue or for the
+    socket, ``run`` stops every answer and closes the socket.
+    """
+
+    def __init__(
+        self,
+        send_text: Callable[[str], Awaitable[None]],
+        receive_text: Callable[[], Awaitable[str]],
+        open_stream: OpenStream,
+        max_streams: int = 8,
+        queue_size: int = 64,
+        coalesce: float = 0.02,
+        send_timeout: float = 10.0,
+        close: Callable[[int], Awaitable[None]] | None = None,
+    ) -> None:
+        self._send_text = send_text
+        self._receive_text = receive_text
+        self._close = close
+        self._open_stream = open_stream
+        self.max_streams = max_streams
+        self.coalesce = coalesce
+        self.send_timeout = send_timeout
+        self._outbox: asyncio.Queue[dict] = asyncio.Queue(maxsize=queue_size)
+        self._streams: dict[Any, asyncio.Task] = {}
+        self._stalled = asyncio.Event()
+        self.frames_sent = 0
+
+    async def _send(self, frame: dict) -> None:
+        try:
+            await asyncio.wait_for(self._outbox.put(frame), self.send_timeout)
+        except asyncio.TimeoutError:
+            self._stalled.set()
+            raise _Stalled from None
+
+    async def _send_error(self, stream_id: Any, detail: str) -> None:
+        try:
+            await self._send({"type": "error", "id": stream_id, "detail": detail})
+        except _Stalled:
+            pass  # ``run`` closes the socket
+
+    async def _writer(self) -> None:
+        while True:
+            frames = [await self._outbox.get()]
+            if self.coalesce:
+                await asyncio.sleep(self.coalesce)
+            while True:
+                try:
+                    frames.append(self._outbox.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            for frame in coalesce_frames(frames):
+                try:
+                    await asyncio.wait_for(
+                        self._send_text(json.dumps(frame)), self.send_timeout
+                    )
+                except asyncio.TimeoutError:
+                    self._stalled.set()
+                    return
+                self.frames_sent += 1
+
+    async def _stream(self, frame: dict) -> None:
+        stream_id = frame["id"]
+        tokens = None
+        try:
+            try:
+                cited, tokens = await self._open_stream(frame)
+                await self._send({"type": "citations", "id": stream_id, "citations": cited})
+                async for token in tokens:
+                    if token:
+                        await self._send({"type": "token", "id": stream_id, "text": token})
+                await self._send({"type": "done", "id": stream_id})
+            finally:
+                # Release the LLM before waiting to report anything.
+                if tokens is not None:
+                    await tokens.aclose()
+        except asyncio.CancelledError:
+            raise
+        except _Stalled:
+            logger.warning("WebSocket stream %r stopped: client is not reading", stream_id)
+        except ValueError as exc:
+            await self._send_error(stream_id, str(exc))
+        except Exception:
+            logger.exception("WebSocket stream %r failed", stream_id)
+            await self._send_error(stream_id, "chat failed")
+        finally:
+            if self._streams.get(stream_id) is asyncio.current_task():
+                del self._streams[stream_id]
+
+    async def _handle(self, text: str) -> None:
+        try:
+            frame = json.loads(text)
+        except ValueError:
+            frame = None
+        if not isinstance(frame, dict) or not isinstance(frame.get("id"), (str, int)):
+            await self._send({"type": "error", "id": None, "detail": "invalid frame"})
+            return
+        stream_id = frame["id"]
+        kind = frame.get("type")
+        if kind == "cancel":
+            task = self._streams.pop(stream_id, None)
+            if task is not None:
+                task.cancel()
+                await self._send({"type": "cancelled", "id": stream_id})
+        elif kind == "chat":
+            if stream_id in self._streams:
+                detail = "id already in use"
+            elif len(self._streams) >= self.max_streams:
+                detail = "too many concurrent messages"
+            else:
+                self._streams[stream_id] = asyncio.create_task(self._stream(frame))
+                return
+            await self._send({"type": "error", "id": stream_id, "detail": detail})
+        else:
+            await self._send({"type": "error", "id": stream_id, "detail": "unknown type"})
+
+    async def _disconnect(self) -> None:
+        logger.warning("Closing WebSocket: client is not reading")
+        if self._close is None:
+            return
+        try:
+            await asyncio.wait_for(self._close(CLOSE_NOT_READING), self.send_timeout)
+        except (asyncio.TimeoutError, RuntimeError):
+            pass  # the server drops the connection once the handler returns
+
+    async def run(self) -> None:
+        """Serve frames until the client disconnects, stops reading or the socket fails."""
+        writer = asyncio.create_task(self._writer())
+        stalled = asyncio.create_task(self._stalled.wait())
+        try:
+            while True:
+                receive = asyncio.ensure_future(self._receive_text())
+                done, _ = await asyncio.wait(
+                    {receive, writer, stalled}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if stalled in done or writer in done:
+                    receive.cancel()
+                    if writer.done():
+                        writer.result()  # re-raise a send failure
+                    break
+                try:
+                    await self._handle(receive.result())
+                except _Stalled:
+                    break
+        finally:
+            tasks = [*self._streams.values(), writer, stalled]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await self._disconnect()
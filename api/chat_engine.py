@@ -38,12 +38,15 @@ class ChatEngine:
         model: str | None = None,
         ollama_model: str | None = None,
         fallback_message: str | None = None,
+        max_concurrency: int = 1,
     ) -> None:
         """Initialize the engine and attempt to configure an LLM backend.
 
         ``model`` and ``ollama_model`` override the ``OPENAI_MODEL`` and
         ``OLLAMA_MODEL`` environment variables when provided. ``fallback_message``
         customizes the demo response shown when no LLM backend is available.
+        ``max_concurrency`` bounds how many generations run at once; the
+        default of one serializes calls for clients that are not thread safe.
         """
         env_model = os.getenv("OPENAI_MODEL")
         env_ollama = os.getenv("OLLAMA_MODEL")
@@ -51,7 +54,7 @@ class ChatEngine:
         self.ollama_model = ollama_model or env_ollama or "llama2"
         self.fallback_message = fallback_message or self.default_fallback_message
         self.llm = None
-        self._lock = asyncio.Lock()
+        self._lock = asyncio.Semaphore(max_concurrency)
         self._init_llm()
 
     @property
@@ -9,15 +9,50 @@ class Settings(BaseSettings):
 
     vector_db_dir: Path = Path("vector_db")
     data_dir: Path = Path("data/santa_barbara")
+    tenants_data_dir: Path = Path("data")
+    max_loaded_cities: int = 4
+    shared_index: bool = False
+    index_dtype: str = "float32"
+    index_rerank: int = 4
+    index_check_interval: float = 2.0
+    embedding_server: str = ""
+    embedding_server_authkey: str = ""
+    embedding_cache_size: int = 0
+    response_cache_size: int = 0
+    response_cache_ttl: float = 600.0
+    traffic_log: str = ""
+    traffic_log_max_bytes: int = 10_000_000
+    traffic_log_backups: int = 3
+    warmup_file: str = ""
+    warmup_questions: int = 50
+    warmup_answers: bool = False
     openai_model: str = "gpt-3.5-turbo"
     ollama_model: str = "llama2"
     log_level: str = "INFO"
+    log_format: str = "text"
+    log_queue: bool = False
+    log_sample_rate: float = 1.0
+    log_token_sample_rate: float = 1.0
     cors_origins: str = "*"
     server_host: str = "0.0.0.0"
     server_port: int = 5000
     scrape_timeout: float = 10.0
     scrape_max_bytes: int = 100000
     max_message_bytes: int = 4000
+    context_candidates: int = 8
+    infer_filters: bool = False
+    llm_concurrency: int = 1
+    batch_size: int = 32
+    batch_concurrency: int = 4
+    ws_max_streams: int = 8
+    ws_send_queue: int = 64
+    ws_coalesce_ms: float = 20.0
+    ws_send_timeout: float = 10.0
+    session_ttl: float = 1800.0
+    max_sessions: int = 10000
+    session_max_turns: int = 6
+    session_summary_tokens: int = 200
+    context_token_budget: int = 1000
     fallback_message: str = (
         "The assistant is running in demo mode. Configure OPENAI_API_KEY for real answers."
     )
@@ -50,6 +85,114 @@ class Settings(BaseSettings):
             raise ValueError("max_message_bytes must be positive")
         return v
 
+    @field_validator("max_loaded_cities")
+    @classmethod
+    def _validate_max_cities(cls, v: int) -> int:
+        if v <= 0:
+            raise ValueError("max_loaded_cities must be positive")
+        return v
+
+    @field_validator("index_dtype")
+    @classmethod
+    def _validate_index_dtype(cls, v: str) -> str:
+        v = v.lower()
+        if v not in ("float32", "float16", "int8"):
+            raise ValueError("index_dtype must be float32, float16 or int8")
+        return v
+
+    @field_validator("index_rerank")
+    @classmethod
+    def _validate_index_rerank(cls, v: int) -> int:
+        if v < 0:
+            raise ValueError("index_rerank must not be negative")
+        return v
+
+    @field_validator("index_check_interval")
+    @classmethod
+    def _validate_check_interval(cls, v: float) -> float:
+        if v < 0:
+            raise ValueError("index_check_interval must not be negative")
+        return v
+
+    @field_validator("context_candidates", "context_token_budget")
+    @classmethod
+    def _validate_context(cls, v: int) -> int:
+        if v <= 0:
+            raise ValueError("context settings must be positive")
+        return v
+
+    @field_validator("log_format")
+    @classmethod
+    def _validate_log_format(cls, v: str) -> str:
+        v = v.lower()
+        if v not in ("text", "json"):
+            raise ValueError("log_format must be text or json")
+        return v
+
+    @field_validator("log_sample_rate", "log_token_sample_rate")
+    @classmethod
+    def _validate_sample_rate(cls, v: float) -> float:
+        if not (0.0 <= v <= 1.0):
+            raise ValueError("log sample rates must be between 0 and 1")
+        return v
+
+    @field_validator(
+        "embedding_cache_size",
+        "response_cache_size",
+        "response_cache_ttl",
+        "traffic_log_backups",
+        "warmup_questions",
+    )
+    @classmethod
+    def _validate_cache(cls, v):
+        if v < 0:
+            raise ValueError("cache, traffic log and warm-up settings must not be negative")
+        return v
+
+    @field_validator("traffic_log_max_bytes")
+    @classmethod
+    def _validate_traffic_log_size(cls, v: int) -> int:
+        if v <= 0:
+            raise ValueError("traffic_log_max_bytes must be positive")
+        return v
+
+    @field_validator("ws_max_streams", "ws_send_queue")
+    @classmethod
+    def _validate_ws_limits(cls, v: int) -> int:
+        if v <= 0:
+            raise ValueError("WebSocket limits must be positive")
+        return v
+
+    @field_validator("ws_send_timeout")
+    @classmethod
+    def _validate_ws_send_timeout(cls, v: float) -> float:
+        if v <= 0:
+            raise ValueError("ws_send_timeout must be positive")
+        return v
+
+    @field_validator("ws_coalesce_ms")
+    @classmethod
+    def _validate_ws_coalesce(cls, v: float) -> float:
+        if v < 0:
+            raise ValueError("ws_coalesce_ms must not be negative")
+        return v
+
+    @field_validator("llm_concurrency", "batch_size", "batch_concurrency")
+    @classmethod
+    def _validate_concurrency(cls, v: int) -> int:
+        if v <= 0:
+            raise ValueError("concurrency and batch settings must be positive")
+        return v
+
+    @field_validator(
+        "session_ttl", "max_sessions", "session_max_turns", "session_summary_tokens"
+    )
+    @classmethod
+    def _validate_sessions(cls, v):
+        if v <= 0:
+            raise ValueError("session settings must be positive")
+        return v
+
     @property
     def allowed_origins(self) -> list[str]:
         """Return the CORS origins parsed from ``cors_origins``."""
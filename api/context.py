@@ -0,0 +1,161 @@
+"""Helpers for packing retrieved chunks into a compact prompt context."""
+
+from __future__ import annotations
+
+import re
+from typing import Iterable, Sequence
+
+__all__ = ["estimate_tokens", "merge_chunks", "drop_near_duplicates", "pack_context"]
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Return a fast local estimate of the number of LLM tokens in ``text``.
+
+    Words and punctuation count as one token each, with long words counted
+    as several pieces the way BPE tokenizers split them.
+    """
+    return sum(1 + len(piece) // 8 for piece in _TOKEN_RE.findall(text))
+
+
+def _source(doc) -> str | None:
+    metadata = getattr(doc, "metadata", None) or {}
+    return metadata.get("source")
+
+
+def _section(doc) -> str:
+    metadata = getattr(doc, "metadata", None) or {}
+    return metadata.get("section") or ""
+
+
+def _without_heading(text: str, heading: str) -> str:
+    """Return ``text`` without a leading ``heading`` line."""
+    if heading and text.startswith(heading + "\n"):
+        return text[len(heading) + 1 :].lstrip()
+    return text
+
+
+def _overlap(left: str, right: str, min_overlap: int, max_overlap: int) -> int:
+    """Return the length of the longest suffix of ``left`` that prefixes ``right``."""
+    probe = right[:min_overlap]
+    if len(probe) < min_overlap:
+        return 0
+    start = max(0, len(left) - max_overlap)
+    idx = left.find(probe, start)
+    while idx != -1:
+        if right.startswith(left[idx:]):
+            return len(left) - idx
+        idx = left.find(probe, idx + 1)
+    return 0
+
+
+def merge_chunks(
+    docs: Iterable,
+    min_overlap: int = 20,
+    max_overlap: int = 200,
+) -> list[str]:
+    """Merge adjacent or overlapping chunks from the same source.
+
+    ``docs`` are retrieved documents in rank order. Chunks whose text is
+    contained in another chunk are dropped and chunks that continue each
+    other (the tail of one repeats the head of the next, as produced by a
+    splitter with ``chunk_overlap``) are stitched into a single passage.
+    Chunks of one ``section`` that each start with its heading, as written by
+    ``SectionChunker``, are compared without that heading so it appears once.
+    The returned passages keep the rank of their best-ranked member.
+    """
+    groups: list[tuple[str | None, str]] = []
+    for doc in docs:
+        source = _source(doc)
+        heading = _section(doc)
+        text = doc.page_content.strip()
+        if not text:
+            continue
+        body = _without_heading(text, heading)
+        for i, (group_source, passage) in enumerate(groups):
+            if group_source != source:
+                continue
+            if text in passage or body in passage:
+                break
+            if passage in text:
+                groups[i] = (source, text)
+                break
+            n = _overlap(passage, body, min_overlap, max_overlap)
+            if n:
+                groups[i] = (source, passage + body[n:])
+                break
+            rest = _without_heading(passage, heading)
+            n = _overlap(text, rest, min_overlap, max_overlap)
+            if n:
+                groups[i] = (source, text + rest[n:])
+                break
+        else:
+            groups.append((source, text))
+    return [passage for _source_name, passage in groups]
+
+
+def _shingles(text: str, size: int = 3) -> set[tuple[str, ...]]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def drop_near_duplicates(passages: Sequence[str], threshold: float = 0.8) -> list[str]:
+    """Return ``passages`` without near-duplicates of higher ranked entries.
+
+    Two passages are near-duplicates when the Jaccard similarity of their
+    word 3-shingles is at least ``threshold``.
+    """
+    kept: list[str] = []
+    kept_shingles: list[set[tuple[str, ...]]] = []
+    for passage in passages:
+        shingles = _shingles(passage)
+        duplicate = False
+        for other in kept_shingles:
+            union = len(shingles | other)
+            if union and len(shingles & other) / union >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(passage)
+            kept_shingles.append(shingles)
+    return kept
+
+
+def _truncate(text: str, budget: int) -> str:
+    """Return the longest word-aligned prefix of ``text`` within ``budget`` tokens."""
+    used = 0
+    end = 0
+    for match in _TOKEN_RE.finditer(text):
+        used += 1 + len(match.group()) // 8
+        if used > budget:
+            break
+        end = match.end()
+    return text[:end]
+
+
+def pack_context(docs: Iterable, budget: int, separator: str = "\n\n") -> str:
+    """Merge, deduplicate and pack ``docs`` into at most ``budget`` tokens.
+
+    Passages are added in rank order; a passage that does not fit is skipped
+    so that smaller, lower ranked passages can still use the remaining
+    budget. When even the best passage is too large it is truncated.
+    """
+    passages = drop_near_duplicates(merge_chunks(docs))
+    sep_tokens = estimate_tokens(separator)
+    packed: list[str] = []
+    remaining = budget
+    for passage in passages:
+        cost = estimate_tokens(passage) + (sep_tokens if packed else 0)
+        if cost <= remaining:
+            packed.append(passage)
+            remaining -= cost
+        elif not packed:
+            truncated = _truncate(passage, remaining)
+            if truncated:
+                packed.append(truncated)
+                remaining -= estimate_tokens(truncated)
+    return separator.join(packed)
@@ -0,0 +1,126 @@
+"""Embedding backends shared by every vector store in the process.
+
+Several uvicorn workers can share a single embedding model by running
+``python -m api.embeddings`` and pointing ``EMBEDDING_SERVER`` at it;
+each worker then talks to that process instead of loading its own model.
+
+The connection exchanges pickles, so anyone who knows the key can run code
+in the embedding process. Both sides refuse to start until
+``EMBEDDING_SERVER_AUTHKEY`` is set to a secret.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from multiprocessing.managers import BaseManager
+from pathlib import Path
+import argparse
+import logging
+
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from .cache import CachedEmbeddings
+from .config import settings
+
+__all__ = ["get_embeddings", "load_local_embeddings", "RemoteEmbeddings", "serve"]
+
+logger = logging.getLogger(__name__)
+
+
+def load_local_embeddings() -> Embeddings:
+    """Return an in-process embedding model, preferring OpenAI when available."""
+    try:
+        return OpenAIEmbeddings(model="text-embedding-3-small")
+    except Exception:
+        model_dir = Path(__file__).parent.parent / "models" / "bge-small-en"
+        name = str(model_dir) if model_dir.exists() else "BAAI/bge-small-en"
+        return HuggingFaceEmbeddings(model_name=name)
+
+
+def _parse_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _require_authkey(authkey: str) -> bytes:
+    if not authkey:
+        raise ValueError("EMBEDDING_SERVER_AUTHKEY must be set to a shared secret")
+    return authkey.encode("utf-8")
+
+
+class _EmbeddingManager(BaseManager):
+    """Manager exposing one embedding model to other local processes."""
+
+
+class RemoteEmbeddings(Embeddings):
+    """Embeddings proxy that forwards calls to the shared embedding process."""
+
+    def __init__(self, address: str, authkey: str) -> None:
+        key = _require_authkey(authkey)
+        _EmbeddingManager.register("embeddings")
+        manager = _EmbeddingManager(address=_parse_address(address), authkey=key)
+        manager.connect()
+        self._remote = manager.embeddings()
+        logger.info("Using embedding server at %s", address)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._remote.embed_documents(list(texts))
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._remote.embed_query(text)
+
+
+def _load_embeddings() -> Embeddings:
+    if settings.embedding_server:
+        try:
+            return RemoteEmbeddings(
+                settings.embedding_server, settings.embedding_server_authkey
+            )
+        except Exception as exc:
+            logger.warning("Embedding server unavailable, loading locally: %s", exc)
+    return load_local_embeddings()
+
+
+@lru_cache(maxsize=1)
+def get_embeddings() -> Embeddings:
+    """Return the embedding model shared by every tenant's vector store.
+
+    With ``EMBEDDING_CACHE_SIZE`` set, vectors of recent queries are cached.
+    """
+    embeddings = _load_embeddings()
+    if settings.embedding_cache_size > 0:
+        return CachedEmbeddings(embeddings, settings.embedding_cache_size)
+    return embeddings
+
+
+def serve(address: str, authkey: str) -> None:
+    """Load the embedding model once and serve it to local workers forever."""
+    key = _require_authkey(authkey)
+    embeddings = load_local_embeddings()
+    _EmbeddingManager.register("embeddings", callable=lambda: embeddings)
+    manager = _EmbeddingManager(address=_parse_address(address), authkey=key)
+    server = manager.get_server()
+    logger.info("Embedding server listening on %s", address)
+    server.serve_forever()
+
+
+def _cli() -> None:
+    parser = argparse.ArgumentParser(
+        description="Serve one embedding model to all local API workers"
+    )
+    parser.add_argument(
+        "--address",
+        default=settings.embedding_server or "127.0.0.1:50055",
+        help="host:port to listen on",
+    )
+    args = parser.parse_args()
+    if not settings.embedding_server_authkey:
+        parser.error("set EMBEDDING_SERVER_AUTHKEY to a shared secret first")
+    serve(args.address, settings.embedding_server_authkey)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    _cli()
@@ -0,0 +1,111 @@
+"""Metadata filters that narrow vector searches to one kind of document.
+
+``data/ingest.py`` stores a ``category`` with every chunk, inferred from the
+file name. Questions are mapped onto the same categories by keyword so a
+question about trash pickup only searches trash documents.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any
+
+__all__ = [
+    "QUERY_CATEGORIES",
+    "is_valid_category",
+    "infer_filter",
+    "to_chroma",
+    "matches",
+    "citations",
+]
+
+# Keep the category names in sync with ``CATEGORY_KEYWORDS`` in data/ingest.py.
+QUERY_CATEGORIES = {
+    "trash": (
+        "trash",
+        "garbage",
+        "recycling",
+        "recycle",
+        "compost",
+        "green waste",
+        "bin",
+        "bins",
+        "pickup",
+        "bulky item",
+    ),
+    "permits": ("permit", "permits", "license", "fence", "remodel", "building permit"),
+    "zoning": ("zoning", "zone", "setback", "height limit", "dwelling unit", "adu"),
+    "council": ("council", "councilmember", "mayor", "agenda", "meeting", "ordinance"),
+}
+
+_CATEGORY_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+_PATTERNS = {
+    category: re.compile(
+        r"\b(?:" + "|".join(re.escape(t) for t in terms) + r")\b", re.IGNORECASE
+    )
+    for category, terms in QUERY_CATEGORIES.items()
+}
+
+
+def is_valid_category(name: str) -> bool:
+    """Return True if ``name`` looks like a category written by ingest."""
+    return bool(_CATEGORY_RE.match(name))
+
+
+def infer_filter(query: str) -> dict[str, str] | None:
+    """Return a ``{"category": ...}`` filter if ``query`` names exactly one category.
+
+    Questions that match no category or several are searched unfiltered.
+    """
+    found = [c for c, pattern in _PATTERNS.items() if pattern.search(query)]
+    if len(found) == 1:
+        return {"category": found[0]}
+    return None
+
+
+def to_chroma(where: dict[str, Any]) -> dict[str, Any]:
+    """Return ``where`` as a Chroma ``filter``; several keys are combined with ``$and``."""
+    if len(where) <= 1:
+        return dict(where)
+    return {"$and": [{key: value} for key, value in where.items()]}
+
+
+def matches(metadata: dict, where: dict[str, Any]) -> bool:
+    """Return True if ``metadata`` satisfies a Chroma-style equality filter."""
+    for key, value in where.items():
+        if key == "$and":
+            if not all(matches(metadata, clause) for clause in value):
+                return False
+        elif isinstance(value, dict):
+            if "$eq" in value and metadata.get(key) != value["$eq"]:
+                return False
+            if "$in" in value and metadata.get(key) not in value["$in"]:
+                return False
+        elif metadata.get(key) != value:
+            return False
+    return True
+
+
+def citations(docs) -> list[dict[str, str]]:
+    """Return the distinct ``source``/``section`` pairs of ``docs`` in rank order."""
+    seen = set()
+    result = []
+    for doc in docs or ():
+        metadata = getattr(doc, "metadata", None) or {}
+        source = metadata.get("source")
+        if not source:
+            continue
+        key = (source, metadata.get("section", ""))
+        if key in seen:
+            continue
+        seen.add(key)
+        result.append(
+            {
+                "source": source,
+                "section": metadata.get("section", ""),
+                "category": metadata.get("category", ""),
+                "date": metadata.get("date", ""),
+            }
+        )
+    return result
@@ -1,21 +1,249 @@
-"""Utilities for configuring application logging."""
+"""Utilities for configuring application logging.
+
+``RequestLogMiddleware`` binds a request id, a sampling decision and a dict
+of stage timings to the context of every request. Records below
+``WARNING`` from unsampled requests are dropped, ``fmt="json"`` emits one
+JSON object per record and ``use_queue`` moves formatting and stream writes
+to a background ``QueueListener`` thread so they do not block the event
+loop; that queue is bounded and drops records once it is full.
+"""
 
 from __future__ import annotations
 
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import IO, Iterator
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
+import random
+import time
+import uuid
+
+__all__ = [
+    "setup_logging",
+    "JsonFormatter",
+    "RequestContextFilter",
+    "start_request",
+    "end_request",
+    "current_request_id",
+    "request_sampled",
+    "token_logging",
+    "record_timing",
+    "timed",
+]
+
+_TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+_timings: ContextVar[dict[str, float] | None] = ContextVar("timings", default=None)
+
+_listener: logging.handlers.QueueListener | None = None
+_sample_rate = 1.0
+_token_sample_rate = 1.0
+
+
+def start_request(request_id: str | None = None) -> tuple:
+    """Bind a request id, sampling decision and timing dict to this context.
+
+    Returns a token to pass to ``end_request``.
+    """
+    rid = request_id or uuid.uuid4().hex[:16]
+    sampled = _sample_rate >= 1.0 or random.random() < _sample_rate
+    return (
+        _request_id.set(rid),
+        _sampled.set(sampled),
+        _timings.set({}),
+    )
+
+
+def end_request(token: tuple) -> None:
+    """Restore the context saved by ``start_request``."""
+    rid, sampled, timings = token
+    _timings.reset(timings)
+    _sampled.reset(sampled)
+    _request_id.reset(rid)
+
+
+def current_request_id() -> str | None:
+    return _request_id.get()
+
+
+def request_sampled() -> bool:
+    """Return True if per-request logs of the current request are kept."""
+    return _sampled.get()
+
+
+def token_logging(logger: logging.Logger) -> bool:
+    """Decide once per stream whether ``logger`` should log its tokens.
+
+    Callers check the result instead of calling ``logger.debug`` per token,
+    so streams pay nothing when debug logging is off or not sampled.
+    """
+    return (
+        logger.isEnabledFor(logging.DEBUG)
+        and _sampled.get()
+        and (_token_sample_rate >= 1.0 or random.random() < _token_sample_rate)
+    )
+
+
+def record_timing(stage: str, ms: float) -> None:
+    """Record how long ``stage`` took for the current request, in milliseconds."""
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = round(ms, 3)
+
+
+def current_timings() -> dict[str, float]:
+    return dict(_timings.get() or {})
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record the duration of the ``with`` block as ``stage``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(stage, (time.perf_counter() - start) * 1000.0)
 
 
-def setup_logging(level: str) -> None:
+class RequestContextFilter(logging.Filter):
+    """Attach the request id and drop records of unsampled requests.
+
+    Runs in the thread that emits the record, where the request context is
+    visible, before the record is queued.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    _RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+        "message",
+        "asctime",
+        "request_id",
+    }
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            payload["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in self._RESERVED and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Queue at most ``MAX_PENDING`` records for the listener; never blocks.
+
+    Records that do not fit are counted in ``dropped``. Each queued record
+    is a copy with its message and traceback already rendered to strings,
+    so it no longer references the caller's arguments or frames, while the
+    listener's formatter still sees the separate record fields it needs
+    for JSON output.
+    """
+
+    MAX_PENDING = 10_000
+
+    def __init__(self, records: queue.Queue) -> None:
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _plain_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # The queue may be full; the listener thread is draining it.
+        self.queue.put(self._sentinel)
+
+
+_plain_formatter = logging.Formatter()
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def setup_logging(
+    level: str,
+    fmt: str = "text",
+    use_queue: bool = False,
+    sample_rate: float = 1.0,
+    token_sample_rate: float = 1.0,
+    stream: IO[str] | None = None,
+) -> None:
     """Configure Python logging.
 
     Parameters
     ----------
     level:
         Logging verbosity name such as ``"INFO"`` or ``"DEBUG"``.
+    fmt:
+        ``"text"`` for human readable lines or ``"json"`` for structured records.
+    use_queue:
+        Write records from a background thread instead of the caller's; at
+        most 10 000 records wait and later ones are dropped.
+    sample_rate:
+        Fraction of requests whose sub-``WARNING`` records are kept.
+    token_sample_rate:
+        Fraction of sampled streams whose individual tokens are logged.
+    stream:
+        Where records are written, ``sys.stderr`` by default.
     """
+    global _listener, _sample_rate, _token_sample_rate
+    _stop_listener()
+    _sample_rate = sample_rate
+    _token_sample_rate = token_sample_rate
     numeric = getattr(logging, level.upper(), logging.INFO)
-    logging.basicConfig(
-        level=numeric,
-        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
-        force=True,
-    )
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(_TEXT_FORMAT)
+    output = logging.StreamHandler(stream)
+    output.setFormatter(formatter)
+    if use_queue:
+        records: queue.Queue = queue.Queue(_BoundedQueueHandler.MAX_PENDING)
+        handler: logging.Handler = _BoundedQueueHandler(records)
+        _listener = _QueueListener(records, output)
+        _listener.start()
+    else:
+        handler = output
+    handler.addFilter(RequestContextFilter())
+    logging.basicConfig(level=numeric, handlers=[handler], force=True)
+
+
+atexit.register(_stop_listener)
@@ -0,0 +1,235 @@
+"""Record anonymized chat and scrape traffic for replay and cache warm-up.
+
+With ``TRAFFIC_LOG`` set, ``TrafficRecorder`` appends one JSON line per
+``/chat``, ``/chat_stream`` and ``/scrape`` request to a rotating log::
+
+    {"ts": 1718000000.123, "path": "/chat", "status": 200,
+     "duration_ms": 812.4, "body": {"message": "when is trash pickup?"}}
+
+E-mail addresses, phone numbers and long digit runs in messages are masked,
+session ids are dropped, scrape URLs lose their query strings and uploaded
+file contents are replaced by their length. Lines are handed to a
+background thread that writes them in batches, so recording never blocks
+the event loop. ``python -m api.replay`` replays the log.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+__all__ = ["anonymize", "anonymize_text", "TrafficLog", "TrafficRecorder"]
+
+logger = logging.getLogger(__name__)
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PHONE_RE = re.compile(r"(?<!\w)\+?\d[\d ().-]{7,}\d(?!\w)")
+_NUMBER_RE = re.compile(r"\d{5,}")
+
+
+def _mask_phone(match: re.Match) -> str:
+    digits = sum(ch.isdigit() for ch in match.group())
+    # Code sections such as 28.04.010 have fewer digits than phone numbers.
+    return "<phone>" if digits >= 10 else match.group()
+
+
+def anonymize_text(text: str) -> str:
+    """Mask e-mail addresses, phone numbers and long numbers in ``text``."""
+    text = _EMAIL_RE.sub("<email>", text)
+    text = _PHONE_RE.sub(_mask_phone, text)
+    return _NUMBER_RE.sub("<number>", text)
+
+
+def anonymize(path: str, body: bytes) -> dict | None:
+    """Return the recordable part of a request body or ``None`` if unusable."""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    if path == "/scrape":
+        record: dict = {}
+        if payload.get("url"):
+            parts = urlsplit(str(payload["url"]))
+            host = parts.netloc.rpartition("@")[2]
+            record["url"] = urlunsplit((parts.scheme, host, parts.path, "", ""))
+        if payload.get("file_content"):
+            record["file_content_chars"] = len(str(payload["file_content"]))
+        return record
+    record = {"message": anonymize_text(str(payload.get("message", "")))}
+    for key in ("city", "category"):
+        if payload.get(key):
+            record[key] = payload[key]
+    if payload.get("session_id"):
+        record["session"] = True
+    return record
+
+
+class TrafficLog:
+    """Append JSON lines to ``path`` from a background thread.
+
+    The file is rotated to ``path.1`` … ``path.<backups>`` once it would
+    exceed ``max_bytes``. At most ``MAX_PENDING`` records wait for the
+    writer; records beyond that, records that fail to write and records
+    written after the writer stopped are counted in ``dropped``. After a
+    write error the file is reopened for the next batch.
+    """
+
+    _BATCH = 256
+    MAX_PENDING = 10_000
+
+    def __init__(self, path: Path, max_bytes: int = 10_000_000, backups: int = 3) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._queue: queue.Queue[str | None] = queue.Queue(self.MAX_PENDING)
+        self._thread = threading.Thread(target=self._run, name="traffic-log", daemon=True)
+        self._thread.start()
+
+    def write(self, record: dict) -> None:
+        """Queue ``record`` for writing; never blocks."""
+        if not self._thread.is_alive():
+            self.dropped += 1
+            return
+        try:
+            self._queue.put_nowait(json.dumps(record))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """Write the queued records and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _rotate(self) -> None:
+        for i in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{i}")
+            if older.exists():
+                os.replace(older, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backups:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+
+    def _append(self, fh, size: int, data: bytes):
+        """Write ``data``, opening or rotating the file first; return ``(fh, size)``."""
+        if fh is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fh = self.path.open("ab")
+            size = fh.tell()
+        if size and size + len(data) > self.max_bytes:
+            fh.close()
+            fh = None
+            self._rotate()
+            fh = self.path.open("ab")
+            size = 0
+        fh.write(data)
+        fh.flush()
+        return fh, size + len(data)
+
+    def _run(self) -> None:
+        fh = None
+        size = 0
+        failing = False
+        stop = False
+        try:
+            while not stop:
+                lines = [self._queue.get()]
+                while len(lines) < self._BATCH:
+                    try:
+                        lines.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in lines:
+                    stop = True
+                    lines = [line for line in lines if line is not None]
+                if not lines:
+                    continue
+                data = ("\n".join(lines) + "\n").encode("utf-8")
+                try:
+                    fh, size = self._append(fh, size, data)
+                except OSError:
+                    if not failing:
+                        logger.exception("Writing traffic log %s failed", self.path)
+                    failing = True
+                    self.dropped += len(lines)
+                    if fh is not None:
+                        try:
+                            fh.close()
+                        except OSError:
+                            pass
+                    fh = None
+                    continue
+                if failing:
+                    logger.info("Writing traffic log %s again", self.path)
+                    failing = False
+        finally:
+            if fh is not None:
+                fh.close()
+
+
+class TrafficRecorder:
+    """ASGI middleware that records chat and scrape requests to a ``TrafficLog``.
+
+    The request body is copied as the application reads it, so streamed
+    bodies are passed through untouched.
+    """
+
+    PATHS = ("/chat", "/chat_stream", "/scrape")
+    MAX_BODY = 256 * 1024
+
+    def __init__(self, app, log: TrafficLog) -> None:
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope, receive, send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+        started = time.time()
+        start = time.monotonic()
+        body = bytearray()
+        status = 500
+
+        async def receive_and_copy():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) <= self.MAX_BODY:
+                body.extend(message.get("body", b""))
+            return message
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_and_copy, send_with_status)
+        finally:
+            record = None
+            if len(body) <= self.MAX_BODY:
+                record = anonymize(scope["path"], bytes(body))
+            if record is not None:
+                self.log.write(
+                    {
+                        "ts": round(started, 3),
+                        "path": scope["path"],
+                        "status": status,
+                        "duration_ms": round((time.monotonic() - start) * 1000.0, 3),
+                        "body": record,
+                    }
+                )
@@ -0,0 +1,193 @@
+"""Replay recorded traffic against a server and find the most asked questions.
+
+Replays a log written by ``TrafficRecorder`` at its original pace, or
+scaled with ``--speed`` (``2`` is twice as fast, ``0`` as fast as
+``--concurrency`` allows), and prints latency and error statistics::
+
+    python -m api.replay traffic.jsonl --url http://localhost:5000 --speed 4
+
+``--top N`` prints the N most frequent questions instead; ``--warm N``
+sends them to ``/chat`` so a running server fills its caches. Servers can
+also warm themselves on startup with ``WARMUP_FILE``.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+from .cache import normalize_question
+
+__all__ = ["load_records", "top_questions", "replay", "warm_server"]
+
+CHAT_PATHS = ("/chat", "/chat_stream")
+
+
+def load_records(paths: Iterable[Path]) -> list[dict]:
+    """Return the records of the traffic logs at ``paths`` ordered by time."""
+    records = []
+    for path in paths:
+        with Path(path).open(encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and "path" in record and "body" in record:
+                    records.append(record)
+    records.sort(key=lambda r: r.get("ts", 0.0))
+    return records
+
+
+def top_questions(records: Iterable[dict], n: int) -> list[dict]:
+    """Return the ``n`` most frequent standalone chat questions.
+
+    Questions are compared after normalizing case and whitespace and are
+    counted per ``city`` and ``category``; follow-ups asked within a
+    session are skipped because their answer depends on the conversation.
+    Each result is a chat request body with an added ``count``.
+    """
+    counts: Counter = Counter()
+    first: dict[tuple, dict] = {}
+    for record in records:
+        body = record.get("body") or {}
+        if record.get("path") not in CHAT_PATHS or body.get("session"):
+            continue
+        if record.get("status", 200) >= 400 or not body.get("message"):
+            continue
+        key = (normalize_question(body["message"]), body.get("city"), body.get("category"))
+        counts[key] += 1
+        first.setdefault(key, body)
+    return [{**first[key], "count": count} for key, count in counts.most_common(n)]
+
+
+def _request_body(record: dict) -> dict:
+    body = dict(record["body"])
+    body.pop("session", None)
+    if "file_content_chars" in body:
+        body["file_content"] = "x" * body.pop("file_content_chars")
+    return body
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def replay(
+    records: list[dict],
+    url: str,
+    speed: float = 1.0,
+    concurrency: int = 64,
+    timeout: float = 60.0,
+) -> dict:
+    """Send ``records`` to the server at ``url`` and return latency statistics.
+
+    Requests are started at their recorded offsets divided by ``speed``
+    (immediately when ``speed`` is ``0``), with at most ``concurrency`` in
+    flight. Streamed responses are read to the end.
+    """
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    limit = asyncio.Semaphore(concurrency)
+    tasks = []
+
+    async def send(client: httpx.AsyncClient, record: dict) -> None:
+        start = time.perf_counter()
+        try:
+            async with client.stream(
+                "POST", record["path"], json=_request_body(record)
+            ) as resp:
+                async for _chunk in resp.aiter_bytes():
+                    pass
+            statuses[resp.status_code] += 1
+        except httpx.HTTPError as exc:
+            statuses[type(exc).__name__] += 1
+        finally:
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            limit.release()
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=url, timeout=timeout) as client:
+        origin = records[0].get("ts", 0.0) if records else 0.0
+        for record in records:
+            if speed > 0:
+                due = (record.get("ts", origin) - origin) / speed
+                delay = due - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await limit.acquire()
+            tasks.append(asyncio.create_task(send(client, record)))
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    errors = sum(c for s, c in statuses.items() if not (isinstance(s, int) and s < 400))
+    return {
+        "requests": len(records),
+        "errors": errors,
+        "statuses": {str(s): c for s, c in statuses.items()},
+        "seconds": round(elapsed, 3),
+        "rps": round(len(records) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50), 2),
+        "p95_ms": round(_percentile(latencies, 0.95), 2),
+        "p99_ms": round(_percentile(latencies, 0.99), 2),
+    }
+
+
+async def warm_server(
+    questions: list[dict], url: str, concurrency: int = 4, timeout: float = 60.0
+) -> int:
+    """Ask a running server ``questions`` through ``/chat``; return the successes."""
+    limit = asyncio.Semaphore(concurrency)
+
+    async def ask(client: httpx.AsyncClient, question: dict) -> bool:
+        body = {k: v for k, v in question.items() if k != "count"}
+        async with limit:
+            try:
+                resp = await client.post("/chat", json=body)
+                return resp.status_code == 200
+            except httpx.HTTPError:
+                return False
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout) as client:
+        results = await asyncio.gather(*(ask(client, q) for q in questions))
+    return sum(results)
+
+
+def _cli() -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded CivicAI traffic")
+    parser.add_argument("logs", nargs="+", type=Path, help="Traffic log files")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="Time scale; 0 sends as fast as possible"
+    )
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--top", type=int, help="Print the N most frequent questions")
+    parser.add_argument("--warm", type=int, help="Send the N most frequent questions")
+    args = parser.parse_args()
+
+    records = load_records(args.logs)
+    if args.top:
+        for question in top_questions(records, args.top):
+            print(json.dumps(question))
+        return
+    if args.warm:
+        questions = top_questions(records, args.warm)
+        ok = asyncio.run(warm_server(questions, args.url))
+        print(f"Warmed {ok}/{len(questions)} questions", file=sys.stderr)
+        return
+    stats = asyncio.run(replay(records, args.url, args.speed, args.concurrency))
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    _cli()
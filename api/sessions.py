@@ -0,0 +1,168 @@
+"""In-memory conversation sessions with bounded size, TTL and LRU eviction.
+
+Sessions are not shared between worker processes: with several uvicorn
+workers, requests for a session must be routed to the worker that created it.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+import re
+import time
+import uuid
+
+from .context import estimate_tokens
+
+__all__ = ["Turn", "Session", "SessionStore", "condense_query"]
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_LEADING_FOLLOW_UP_RE = re.compile(
+    r"^(and|also|what about|how about|what if|but|or|then)\b", re.IGNORECASE
+)
+_REFERENCE_RE = re.compile(
+    r"\b(it|its|that|those|these|this|they|them|there)\b", re.IGNORECASE
+)
+# Pronouns only mark a follow-up in short messages; longer questions use
+# "is there" or "that" without referring back.
+_SHORT_REFERENCE_WORDS = 12
+
+
+class Turn:
+    """A single message in a conversation."""
+
+    __slots__ = ("is_user", "text")
+
+    def __init__(self, is_user: bool, text: str) -> None:
+        self.is_user = is_user
+        self.text = text
+
+    def render(self) -> str:
+        return f"{'User' if self.is_user else 'Assistant'}: {self.text}"
+
+
+class Session:
+    """Recent turns of a conversation plus a rolling summary of older ones."""
+
+    __slots__ = ("turns", "summary", "last_access")
+
+    def __init__(self, now: float) -> None:
+        self.turns: list[Turn] = []
+        self.summary: list[str] = []
+        self.last_access = now
+
+    def history(self) -> str:
+        """Return the summary and recent turns formatted for a prompt."""
+        lines = []
+        if self.summary:
+            lines.append("Earlier: " + " ".join(self.summary))
+        lines.extend(turn.render() for turn in self.turns)
+        return "\n".join(lines)
+
+    def last_user_message(self) -> str | None:
+        for turn in reversed(self.turns):
+            if turn.is_user:
+                return turn.text
+        return None
+
+
+def _brief(turn: Turn, max_words: int = 30) -> str:
+    """Return the first sentence of ``turn`` capped at ``max_words`` words."""
+    sentence = _SENTENCE_RE.split(turn.text.strip(), maxsplit=1)[0]
+    words = sentence.split()
+    if len(words) > max_words:
+        sentence = " ".join(words[:max_words]) + "..."
+    return f"{'Q' if turn.is_user else 'A'}: {sentence}"
+
+
+def condense_query(session: Session | None, message: str) -> str:
+    """Return a standalone retrieval query for ``message``.
+
+    Follow-ups such as "what about on holidays?" are short, start with a
+    connective or refer back with a pronoun, so the previous user message
+    is prepended to give the vector search something to match against.
+    Standalone questions are returned unchanged.
+    """
+    if session is None:
+        return message
+    previous = session.last_user_message()
+    if not previous:
+        return message
+    words = len(message.split())
+    if (
+        words <= 6
+        or _LEADING_FOLLOW_UP_RE.match(message.lstrip())
+        or (words <= _SHORT_REFERENCE_WORDS and _REFERENCE_RE.search(message))
+    ):
+        return f"{previous} {message}"
+    return message
+
+
+class SessionStore:
+    """Keep a bounded number of sessions, evicting idle ones first.
+
+    Sessions expire ``ttl`` seconds after their last use and at most
+    ``max_sessions`` are kept; the least recently used session is evicted
+    when the limit is reached. Each session keeps its last ``max_turns``
+    turns verbatim (each truncated to ``max_turn_chars``) and folds older
+    turns into an extractive summary of at most ``summary_tokens`` tokens.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 1800.0,
+        max_sessions: int = 10000,
+        max_turns: int = 6,
+        summary_tokens: int = 200,
+        max_turn_chars: int = 2000,
+    ) -> None:
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.summary_tokens = summary_tokens
+        self.max_turn_chars = max_turn_chars
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expire(self, now: float) -> None:
+        # Sessions are ordered by last access, so expired ones are at the front.
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access < self.ttl:
+                break
+            del self._sessions[session_id]
+
+    def create(self) -> str:
+        """Start a new session and return its id."""
+        now = time.monotonic()
+        self._expire(now)
+        while len(self._sessions) >= self.max_sessions:
+            self._sessions.popitem(last=False)
+        session_id = uuid.uuid4().hex
+        self._sessions[session_id] = Session(now)
+        return session_id
+
+    def get(self, session_id: str) -> Session | None:
+        """Return the session for ``session_id`` or ``None`` if unknown or expired."""
+        now = time.monotonic()
+        self._expire(now)
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.last_access = now
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def append(self, session: Session, is_user: bool, text: str) -> None:
+        """Record a turn, summarizing the oldest turns beyond ``max_turns``."""
+        session.turns.append(Turn(is_user, text[: self.max_turn_chars]))
+        if len(session.turns) <= self.max_turns:
+            return
+        overflow = len(session.turns) - self.max_turns
+        session.summary.extend(_brief(turn) for turn in session.turns[:overflow])
+        del session.turns[:overflow]
+        while (
+            len(session.summary) > 1
+            and estimate_tokens(" ".join(session.summary)) > self.summary_tokens
+        ):
+            del session.summary[0]
@@ -0,0 +1,201 @@
+"""Per-city vector store registry for serving several municipalities."""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable
+import logging
+import re
+import threading
+import time
+
+from .config import settings
+
+__all__ = ["is_valid_city", "tenant_paths", "tenant_exists", "VectorStoreRegistry"]
+
+logger = logging.getLogger(__name__)
+
+_CITY_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+def is_valid_city(city: str) -> bool:
+    """Return True if ``city`` is a safe tenant identifier such as ``santa_barbara``."""
+    return bool(_CITY_RE.match(city))
+
+
+def tenant_paths(city: str | None) -> tuple[Path, Path]:
+    """Return the ``(data_dir, vector_db_dir)`` pair used for ``city``.
+
+    ``None`` selects the default single-tenant paths from the settings.
+    """
+    if city is None:
+        return settings.data_dir, settings.vector_db_dir
+    if not is_valid_city(city):
+        raise ValueError(f"invalid city: {city!r}")
+    return settings.tenants_data_dir / city, settings.vector_db_dir / city
+
+
+def tenant_exists(city: str | None) -> bool:
+    """Return True if ``city`` has been ingested; the default tenant (``None``) always counts."""
+    return city is None or tenant_paths(city)[1].exists()
+
+
+class VectorStoreRegistry:
+    """Lazily load vector stores per city and evict the least recently used.
+
+    ``loader`` is called with the city name (``None`` for the default tenant)
+    the first time a store is requested. At most ``max_stores`` stores are
+    kept in memory; loading another one evicts the store that has been idle
+    the longest. Stores that failed to load (``None``) are remembered apart
+    from the loaded ones, so a missing database is not probed on every
+    request and never evicts a working store. Loads run outside the
+    registry lock, one at a time per city, so a slow load only delays
+    requests for the same city. ``unload``, when given, is called with each
+    store the registry evicts so it can release what the loader opened.
+
+    When ``version`` is given it is called with the city at most every
+    ``check_interval`` seconds; a store whose version changed since it was
+    loaded is dropped (and unloaded) and reloaded on the next ``get``. This
+    lets every worker process pick up an ingest performed by any one of them.
+    ``current_version`` exposes the same throttled check to other caches.
+    """
+
+    MAX_MISSING = 256
+
+    def __init__(
+        self,
+        loader: Callable[[str | None], Any],
+        max_stores: int = 4,
+        version: Callable[[str | None], int] | None = None,
+        check_interval: float = 2.0,
+        unload: Callable[[Any], None] | None = None,
+    ) -> None:
+        if max_stores <= 0:
+            raise ValueError("max_stores must be positive")
+        self._loader = loader
+        self.max_stores = max_stores
+        self._version = version
+        self.check_interval = check_interval
+        self._unload = unload
+        self._stores: OrderedDict[str | None, Any] = OrderedDict()
+        self._missing: OrderedDict[str | None, None] = OrderedDict()
+        self._versions: dict[str | None, int] = {}
+        # Latest version read per city and when it was read.
+        self._latest: OrderedDict[str | None, tuple[int, float]] = OrderedDict()
+        self._loading: dict[str | None, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, city: str | None) -> bool:
+        return city in self._stores
+
+    def __len__(self) -> int:
+        return len(self._stores)
+
+    def _drop_if_stale(self, city: str | None) -> None:
+        if self._version is None or (city not in self._stores and city not in self._missing):
+            return
+        if self.current_version(city) != self._versions.get(city):
+            logger.info("Vector store for %s changed on disk", city or "default")
+            store = self._stores.pop(city, None)
+            self._missing.pop(city, None)
+            if store is not None:
+                self._release([store])
+
+    def _remember_version(self, city: str | None, version: int, now: float) -> None:
+        self._latest[city] = (version, now)
+        self._latest.move_to_end(city)
+        while len(self._latest) > self.max_stores + self.MAX_MISSING:
+            self._latest.popitem(last=False)
+
+    def current_version(self, city: str | None) -> int | None:
+        """Return the version of ``city``, read at most every ``check_interval`` seconds.
+
+        Between reads this is a dict lookup, cheap enough for the event loop.
+        Returns ``None`` without a ``version`` callable.
+        """
+        if self._version is None:
+            return None
+        now = time.monotonic()
+        latest = self._latest.get(city)
+        if latest is None or now - latest[1] >= self.check_interval:
+            latest = (self._version(city), now)
+            self._remember_version(city, *latest)
+        return latest[0]
+
+    def _release(self, stores: list[Any]) -> None:
+        if self._unload is None:
+            return
+        for store in stores:
+            try:
+                self._unload(store)
+            except Exception as exc:
+                logger.warning("Failed to unload vector store: %s", exc)
+
+    def _lookup(self, city: str | None) -> tuple[bool, Any]:
+        self._drop_if_stale(city)
+        if city in self._stores:
+            self._stores.move_to_end(city)
+            return True, self._stores[city]
+        if city in self._missing:
+            return True, None
+        return False, None
+
+    def try_get(self, city: str | None) -> tuple[bool, Any]:
+        """Return ``(True, store)`` if ``city`` is loaded and current.
+
+        Never loads a store or waits for another thread doing so, which makes
+        it safe to call from the event loop; ``(False, None)`` means the
+        caller should fall back to ``get`` in a worker thread.
+        """
+        if not self._lock.acquire(blocking=False):
+            return False, None
+        try:
+            return self._lookup(city)
+        finally:
+            self._lock.release()
+
+    def get(self, city: str | None) -> Any:
+        """Return the store for ``city``, loading it on first use."""
+        with self._lock:
+            found, store = self._lookup(city)
+            if found:
+                return store
+            loading = self._loading.setdefault(city, threading.Lock())
+        try:
+            with loading:
+                with self._lock:
+                    found, store = self._lookup(city)
+                if found:
+                    return store
+                version = self._version(city) if self._version is not None else None
+                store = self._loader(city)
+                evicted_stores = []
+                with self._lock:
+                    if version is not None:
+                        self._versions[city] = version
+                        self._remember_version(city, version, time.monotonic())
+                    if store is None:
+                        self._missing[city] = None
+                        while len(self._missing) > self.MAX_MISSING:
+                            self._missing.popitem(last=False)
+                        return None
+                    self._stores[city] = store
+                    while len(self._stores) > self.max_stores:
+                        evicted, old = self._stores.popitem(last=False)
+                        evicted_stores.append(old)
+                        logger.info("Evicted vector store for %s", evicted or "default")
+                self._release(evicted_stores)
+                return store
+        finally:
+            with self._lock:
+                if self._loading.get(city) is loading and not loading.locked():
+                    del self._loading[city]
+
+    def evict(self, city: str | None) -> None:
+        """Drop the cached store for ``city`` so the next ``get`` reloads it."""
+        with self._lock:
+            store = self._stores.pop(city, None)
+            self._missing.pop(city, None)
+        if store is not None:
+            self._release([store])
@@ -30,33 +30,50 @@ def is_public_url(url: str) -> bool:
         return True
 
 
+_BLOCK_TAGS = frozenset(
+    {"h1", "h2", "h3", "h4", "h5", "h6", "p", "li", "br", "div", "tr", "title"}
+)
+
+
 class _TextExtractor(HTMLParser):
     """Internal HTML parser that collects text while skipping script/style tags."""
 
-    def __init__(self) -> None:
+    def __init__(self, keep_lines: bool = False) -> None:
         super().__init__()
         self.parts: list[str] = []
         self._skip: bool = False
+        self._keep_lines = keep_lines
 
     def handle_starttag(self, tag: str, _attrs) -> None:  # pragma: no cover - trivial
         if tag in {"script", "style"}:
             self._skip = True
+        elif self._keep_lines and tag in _BLOCK_TAGS:
+            self.parts.append("\n")
 
     def handle_endtag(self, tag: str) -> None:  # pragma: no cover - trivial
         if tag in {"script", "style"}:
             self._skip = False
+        elif self._keep_lines and tag in _BLOCK_TAGS:
+            self.parts.append("\n")
 
     def handle_data(self, data: str) -> None:  # pragma: no cover - trivial
         if not self._skip:
             self.parts.append(data)
 
     def text(self) -> str:
-        return " ".join(" ".join(self.parts).split())
+        if not self._keep_lines:
+            return " ".join(" ".join(self.parts).split())
+        lines = (" ".join(line.split()) for line in "".join(self.parts).split("\n"))
+        return "\n".join(line for line in lines if line)
+
 
+def html_to_text(html: str, keep_lines: bool = False) -> str:
+    """Return ``html`` with tags stripped and whitespace normalized.
 
-def html_to_text(html: str) -> str:
-    """Return ``html`` with tags stripped and whitespace normalized."""
-    parser = _TextExtractor()
+    With ``keep_lines`` headings, paragraphs, list items, line breaks and
+    divs start new lines, so the document structure survives for chunking.
+    """
+    parser = _TextExtractor(keep_lines)
     parser.feed(html)
     return parser.text()
 
@@ -0,0 +1,276 @@
+"""Read-only vector index shared between worker processes via ``mmap``.
+
+``data/ingest.py`` exports every ingest to ``<db_dir>/shared_index/<n>/``
+and then atomically writes ``n`` to ``<db_dir>/GENERATION``. The files are
+opened with ``numpy.load(mmap_mode="r")`` so all workers on a host read the
+same page-cache pages instead of holding private copies, and workers reload
+as soon as they observe a new generation number.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import json
+import logging
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .filters import matches
+
+__all__ = [
+    "GENERATION_FILE",
+    "SHARED_INDEX_DIR",
+    "CATEGORY_CODES_FILE",
+    "CATEGORY_NAMES_FILE",
+    "read_generation",
+    "encode_categories",
+    "SharedIndex",
+]
+
+logger = logging.getLogger(__name__)
+
+GENERATION_FILE = "GENERATION"
+SHARED_INDEX_DIR = "shared_index"
+# Per-chunk category codes (-1 for none) and the category name of each code.
+CATEGORY_CODES_FILE = "categories.npy"
+CATEGORY_NAMES_FILE = "categories.json"
+
+
+def read_generation(db_dir: Path) -> int:
+    """Return the ingest generation recorded in ``db_dir`` or ``0`` if none."""
+    try:
+        return int((db_dir / GENERATION_FILE).read_text().strip())
+    except (OSError, ValueError):
+        return 0
+
+
+def encode_categories(metadatas) -> tuple[np.ndarray, list[str]]:
+    """Return an int32 category code per metadata dict and the sorted names."""
+    categories = [(meta or {}).get("category") for meta in metadatas]
+    names = sorted({c for c in categories if isinstance(c, str)})
+    index = {name: code for code, name in enumerate(names)}
+    codes = np.fromiter(
+        (index.get(c, -1) if isinstance(c, str) else -1 for c in categories),
+        dtype=np.int32,
+        count=len(categories),
+    )
+    return codes, names
+
+
+def _category_values(where: dict) -> list | None:
+    """Return the categories accepted by a filter on ``category`` alone, else None."""
+    if list(where) != ["category"]:
+        return None
+    value = where["category"]
+    if not isinstance(value, dict):
+        return [value]
+    if list(value) == ["$eq"]:
+        return [value["$eq"]]
+    if list(value) == ["$in"]:
+        return list(value["$in"])
+    return None
+
+
+class SharedIndex:
+    """Brute-force cosine search over memory-mapped, normalized embeddings.
+
+    Exposes the subset of the LangChain ``Chroma`` interface used by the API
+    so it can be used wherever a vector store is expected.
+
+    ``dtype`` selects which stored copy of the vectors is scanned:
+    ``float32``, ``float16`` (half the memory) or ``int8`` (a quarter, with
+    one float32 scale per vector). With a lower precision and ``rerank``
+    greater than one, ``k * rerank`` candidates are re-scored against the
+    float32 vectors, touching only those rows of the full-precision file.
+
+    Searches accept a Chroma-style metadata ``filter``; only the matching
+    rows are scored. Filters on ``category`` alone are answered from the
+    exported per-chunk category codes; any other filter decodes every chunk
+    record once and caches the matching rows.
+    """
+
+    DTYPES = ("float32", "float16", "int8")
+    _BLOCK = 1024
+    _MAX_FILTERS = 32
+
+    def __init__(
+        self, index_dir: Path, embeddings, dtype: str = "float32", rerank: int = 0
+    ) -> None:
+        if dtype not in self.DTYPES:
+            raise ValueError(f"unsupported index dtype: {dtype!r}")
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self.rerank = rerank
+        self._vectors = np.load(index_dir / "embeddings.npy", mmap_mode="r")
+        self._offsets = np.load(index_dir / "offsets.npy", mmap_mode="r")
+        self._records = np.memmap(index_dir / "chunks.bin", dtype=np.uint8, mode="r")
+        self._scales = None
+        self._filter_rows: dict[str, np.ndarray] = {}
+        self._filter_lock = threading.Lock()
+        if (index_dir / CATEGORY_CODES_FILE).exists():
+            self._categories = np.load(index_dir / CATEGORY_CODES_FILE, mmap_mode="r")
+            names = json.loads((index_dir / CATEGORY_NAMES_FILE).read_text())
+        else:
+            # Exported before category codes were written: decode once at load.
+            self._categories, names = encode_categories(
+                self._metadata(i) for i in range(len(self))
+            )
+        self._category_codes = {name: code for code, name in enumerate(names)}
+        if dtype != "float32" and not (index_dir / f"embeddings_{dtype}.npy").exists():
+            logger.warning("No %s vectors in %s, using float32", dtype, index_dir)
+            dtype = "float32"
+        self.dtype = dtype
+        if dtype == "float32":
+            self._matrix = self._vectors
+        else:
+            self._matrix = np.load(index_dir / f"embeddings_{dtype}.npy", mmap_mode="r")
+        if dtype == "int8":
+            self._scales = np.load(index_dir / "scales_int8.npy", mmap_mode="r")
+
+    @classmethod
+    def load(
+        cls, db_dir: Path, embeddings, dtype: str = "float32", rerank: int = 0
+    ) -> "SharedIndex | None":
+        """Open the index for the current generation of ``db_dir`` if present."""
+        generation = read_generation(db_dir)
+        index_dir = db_dir / SHARED_INDEX_DIR / str(generation)
+        if not generation or not (index_dir / "embeddings.npy").exists():
+            return None
+        index = cls(index_dir, embeddings, dtype=dtype, rerank=rerank)
+        logger.info(
+            "Mapped shared %s index generation %d from %s",
+            index.dtype,
+            generation,
+            db_dir,
+        )
+        return index
+
+    def __len__(self) -> int:
+        return int(self._vectors.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of vector data scanned per query."""
+        size = self._matrix.nbytes
+        if self._scales is not None:
+            size += self._scales.nbytes
+        return int(size)
+
+    def _record(self, i: int) -> dict:
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return json.loads(self._records[start:end].tobytes().decode("utf-8"))
+
+    def _metadata(self, i: int) -> dict:
+        return self._record(i)["metadata"]
+
+    def _document(self, i: int) -> Document:
+        record = self._record(i)
+        return Document(page_content=record["text"], metadata=record["metadata"])
+
+    def matching_rows(self, where: dict) -> np.ndarray:
+        """Return the indexes of the chunks whose metadata matches ``where``."""
+        values = _category_values(where)
+        if values is not None:
+            codes = [
+                self._category_codes[v]
+                for v in values
+                if isinstance(v, str) and v in self._category_codes
+            ]
+            return np.flatnonzero(np.isin(self._categories, codes)).astype(np.int64)
+        key = json.dumps(where, sort_keys=True)
+        with self._filter_lock:
+            rows = self._filter_rows.get(key)
+            if rows is None:
+                rows = np.fromiter(
+                    (i for i in range(len(self)) if matches(self._metadata(i), where)),
+                    dtype=np.int64,
+                )
+                if len(self._filter_rows) >= self._MAX_FILTERS:
+                    self._filter_rows.pop(next(iter(self._filter_rows)))
+                self._filter_rows[key] = rows
+        return rows
+
+    def _scores(self, queries: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        """Return a ``(n, len(queries))`` matrix of approximate similarities.
+
+        ``rows`` restricts scoring to those chunks, in that order.
+        """
+        if self.dtype == "float32" and rows is None:
+            return self._matrix @ queries.T
+        n = len(self) if rows is None else len(rows)
+        scores = np.empty((n, len(queries)), dtype=np.float32)
+        # Dequantize block by block to bound the temporary float32 copy.
+        for start in range(0, n, self._BLOCK):
+            if rows is None:
+                block = self._matrix[start : start + self._BLOCK]
+            else:
+                block = self._matrix[rows[start : start + self._BLOCK]]
+            scores[start : start + self._BLOCK] = (
+                np.asarray(block, dtype=np.float32) @ queries.T
+            )
+        if self._scales is not None:
+            scales = self._scales if rows is None else self._scales[rows]
+            scores *= scales[:, None]
+        return scores
+
+    def search(
+        self, queries: np.ndarray, k: int, where: dict | None = None
+    ) -> list[np.ndarray]:
+        """Return the indexes of the top ``k`` chunks for each query row.
+
+        With ``where`` only chunks whose metadata match are considered.
+        """
+        rows = self.matching_rows(where) if where else None
+        n = len(self) if rows is None else len(rows)
+        if n == 0:
+            return [np.empty(0, dtype=np.int64) for _ in queries]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = (queries / norms).astype(np.float32)
+        k = min(k, n)
+        fetch = k
+        if self.dtype != "float32" and self.rerank > 1:
+            fetch = min(n, k * self.rerank)
+        scores = self._scores(queries, rows)
+        top = np.argpartition(-scores, fetch - 1, axis=0)[:fetch].T
+        results = []
+        for column, candidates in enumerate(top):
+            if fetch > k:
+                candidates = np.sort(candidates)
+                ids = candidates if rows is None else rows[candidates]
+                exact = self._vectors[ids] @ queries[column]
+                results.append(ids[np.argsort(-exact)[:k]])
+            else:
+                order = candidates[np.argsort(-scores[candidates, column])]
+                results.append(order if rows is None else rows[order])
+        return results
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, filter: dict | None = None, **_kwargs
+    ) -> list[Document]:
+        """Return the ``k`` chunks most similar to ``embedding``."""
+        return self.similarity_search_by_vectors([embedding], k=k, filter=filter)[0]
+
+    def similarity_search_by_vectors(
+        self, embeddings: list[list[float]], k: int = 4, filter: dict | None = None
+    ) -> list[list[Document]]:
+        """Return the ``k`` most similar chunks for each of ``embeddings``.
+
+        All queries are scored with a single pass over the vectors.
+        """
+        if not len(embeddings):
+            return []
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        return [
+            [self._document(int(i)) for i in indexes]
+            for indexes in self.search(queries, k, where=filter)
+        ]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: dict | None = None, **kwargs
+    ) -> list[Document]:
+        """Embed ``query`` and return the ``k`` most similar chunks."""
+        vector = self.embeddings.embed_query(query)
+        return self.similarity_search_by_vector(vector, k=k, filter=filter, **kwargs)
@@ -0,0 +1,79 @@
+"""Measure document extraction throughput against the number of workers.
+
+Extracts a directory of documents with 1, 2, 4, … worker processes up to
+the CPU count, then once more from a warm cache::
+
+    python -m benchmarks.extraction --data-dir data/santa_barbara
+
+Without ``--data-dir`` a synthetic corpus of ``--files`` HTML and DOCX
+agendas is generated in a temporary directory.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import os
+import tempfile
+import zipfile
+
+from data.extract import extract_documents
+from data.ingest import document_paths
+
+_PARAGRAPH = (
+    "The Council will consider an ordinance amending Chapter 28.04 of the "
+    "Municipal Code regarding fence heights, setbacks and accessory dwelling "
+    "units in residential zones. "
+)
+
+
+def write_corpus(directory: Path, files: int, paragraphs: int) -> None:
+    """Write ``files`` synthetic documents, alternating HTML and DOCX."""
+    ns = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+    for i in range(files):
+        items = [f"Item {n}. {_PARAGRAPH * 3}" for n in range(paragraphs)]
+        if i % 2:
+            body = "".join(f"<p><b>Item</b> {item}</p>" for item in items)
+            (directory / f"agenda_{i}.html").write_text(
+                f"<html><head><style>p{{}}</style></head><body>{body}</body></html>"
+            )
+        else:
+            body = "".join(f"<w:p><w:r><w:t>{item}</w:t></w:r></w:p>" for item in items)
+            with zipfile.ZipFile(directory / f"minutes_{i}.docx", "w") as archive:
+                archive.writestr(
+                    "word/document.xml",
+                    f'<w:document xmlns:w="{ns}"><w:body>{body}</w:body></w:document>',
+                )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-dir", type=Path)
+    parser.add_argument("--files", type=int, default=400)
+    parser.add_argument("--paragraphs", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = Path(tmp) / "corpus"
+            data_dir.mkdir()
+            write_corpus(data_dir, args.files, args.paragraphs)
+        paths = document_paths(data_dir)
+        cpus = os.cpu_count() or 1
+        counts = sorted({1, cpus, *(2**n for n in range(1, 8) if 2**n < cpus)})
+        for workers in counts:
+            _docs, report = extract_documents(paths, workers=workers)
+            rate = report["files"] / max(report["seconds"], 1e-3)
+            print(
+                f"{workers:>3} workers: {report['files']} files in "
+                f"{report['seconds']:.2f}s ({rate:.0f} files/s)"
+            )
+        cache = Path(tmp) / "cache"
+        extract_documents(paths, cache_dir=cache)
+        _docs, report = extract_documents(paths, cache_dir=cache)
+        print(f"cached:      {report['files']} files in {report['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
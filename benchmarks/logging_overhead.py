@@ -0,0 +1,111 @@
+"""Measure the logging cost each request adds to the event loop thread.
+
+Simulates the records one ``/chat_stream`` request produces (request debug
+line, per-token debug lines and the access log line) for several logging
+configurations and reports the time spent in the calling thread::
+
+    python -m benchmarks.logging_overhead --requests 2000 --tokens 50
+
+Records are written to a stream that sleeps ``--write-us`` microseconds per
+write, standing in for a stderr pipe whose reader cannot keep up.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from api import logging_utils as lu
+
+CONFIGS = [
+    # name, level, fmt, use_queue, sample_rate
+    ("text sync", "INFO", "text", False, 1.0),
+    ("json sync", "INFO", "json", False, 1.0),
+    ("text queue", "INFO", "text", True, 1.0),
+    ("json queue", "INFO", "json", True, 1.0),
+    ("json queue 10%", "INFO", "json", True, 0.1),
+    ("json queue debug", "DEBUG", "json", True, 1.0),
+    ("warning only", "WARNING", "json", True, 1.0),
+]
+
+
+class SlowStream:
+    """Text stream that blocks for ``delay`` seconds on every write."""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def simulate(logger: logging.Logger, requests: int, tokens: int) -> list[float]:
+    """Return the per-request logging time in microseconds."""
+    timings = []
+    for n in range(requests):
+        start = time.perf_counter()
+        token = lu.start_request()
+        logger.debug("POST /chat_stream called with: %s", "when is trash pickup?")
+        log_tokens = lu.token_logging(logger)
+        for i in range(tokens):
+            if log_tokens:
+                logger.debug("stream token: %s", i)
+        lu.record_timing("generate", 1.0)
+        if lu.request_sampled() and logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "%s %s %s %.2fms",
+                "POST",
+                "/chat_stream",
+                200,
+                1.0,
+                extra={"status": 200, "timings": lu.current_timings()},
+            )
+        lu.end_request(token)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def run(requests: int, tokens: int, write_us: float) -> list[dict]:
+    logger = logging.getLogger("benchmarks.logging")
+    stream = SlowStream(write_us / 1e6)
+    rows = []
+    try:
+        for name, level, fmt, use_queue, rate in CONFIGS:
+            lu.setup_logging(
+                level, fmt=fmt, use_queue=use_queue, sample_rate=rate, stream=stream
+            )
+            timings = simulate(logger, requests, tokens)
+            rows.append(
+                {
+                    "config": name,
+                    "mean_us": float(np.mean(timings)),
+                    "p99_us": float(np.percentile(timings, 99)),
+                }
+            )
+    finally:
+        lu.setup_logging("INFO")
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--write-us", type=float, default=50.0)
+    args = parser.parse_args()
+
+    rows = run(args.requests, args.tokens, args.write_us)
+    print(f"{'config':<18} {'mean us':>9} {'p99 us':>9}")
+    for row in rows:
+        print(f"{row['config']:<18} {row['mean_us']:>9.1f} {row['p99_us']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
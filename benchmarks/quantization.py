@@ -0,0 +1,135 @@
+"""Compare memory, latency and recall of quantized shared-index storage.
+
+Runs against the shared index exported by the last ingest::
+
+    python -m benchmarks.quantization --db-dir vector_db
+
+or, when no large corpus has been ingested yet, against synthetic
+clustered vectors of realistic size::
+
+    python -m benchmarks.quantization --synthetic 100000 --dim 384
+
+Queries are corpus vectors with added noise. Recall@k is measured against
+exact float32 search, so it reports how much of the float32 result each
+storage option preserves.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from api.vector_index import SHARED_INDEX_DIR, SharedIndex, read_generation
+from data.ingest import export_shared_index
+
+CONFIGS = [
+    ("float32", 0),
+    ("float16", 0),
+    ("float16", 4),
+    ("int8", 0),
+    ("int8", 4),
+]
+
+
+class _ArrayStore:
+    """Minimal stand-in for a Chroma store holding synthetic vectors."""
+
+    def __init__(self, vectors: np.ndarray) -> None:
+        self.vectors = vectors
+
+    def get(self, include=None):
+        n = len(self.vectors)
+        return {
+            "embeddings": self.vectors,
+            "documents": [f"chunk {i}" for i in range(n)],
+            "metadatas": [{} for _ in range(n)],
+        }
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Return ``n`` clustered unit vectors resembling sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(n // 50, 1), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=n)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run(db_dir: Path, queries: int, k: int, seed: int = 0) -> list[dict]:
+    """Benchmark every configuration in ``CONFIGS`` on the index in ``db_dir``."""
+    baseline = SharedIndex.load(db_dir, embeddings=None)
+    if baseline is None:
+        raise SystemExit(f"No shared index in {db_dir}; run data/ingest.py first")
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(baseline._vectors)
+    picks = rng.integers(0, len(vectors), size=queries)
+    probes = vectors[picks] + 0.05 * rng.normal(size=(queries, vectors.shape[1]))
+    probes = probes.astype(np.float32)
+    truth = baseline.search(probes, k)
+
+    rows = []
+    for dtype, rerank in CONFIGS:
+        index = SharedIndex.load(db_dir, embeddings=None, dtype=dtype, rerank=rerank)
+        index.search(probes[:1], k)  # warm up the page cache
+        latencies = []
+        hits = 0
+        for probe, expected in zip(probes, truth):
+            start = time.perf_counter()
+            found = index.search(probe[None, :], k)[0]
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            hits += len(np.intersect1d(found, expected))
+        rows.append(
+            {
+                "dtype": dtype,
+                "rerank": rerank,
+                "mib": index.nbytes / 2**20,
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+                "recall": hits / (len(probes) * min(k, len(index))),
+            }
+        )
+    return rows
+
+
+def format_table(rows: list[dict], k: int) -> str:
+    lines = [
+        f"{'dtype':<8} {'rerank':>6} {'MiB':>9} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'recall@' + str(k):>9}"
+    ]
+    for row in rows:
+        lines.append(
+            f"{row['dtype']:<8} {row['rerank']:>6} {row['mib']:>9.2f} "
+            f"{row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} {row['recall']:>9.3f}"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-dir", type=Path, default=Path("vector_db"))
+    parser.add_argument("--synthetic", type=int, help="Benchmark N random vectors")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_dir = Path(tmp)
+            export_shared_index(
+                _ArrayStore(synthetic_vectors(args.synthetic, args.dim)), db_dir
+            )
+            rows = run(db_dir, args.queries, args.k)
+    else:
+        generation = read_generation(args.db_dir)
+        print(f"Index: {args.db_dir / SHARED_INDEX_DIR / str(generation)}")
+        rows = run(args.db_dir, args.queries, args.k)
+    print(format_table(rows, args.k))
+
+
+if __name__ == "__main__":
+    main()
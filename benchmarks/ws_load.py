@@ -0,0 +1,254 @@
+"""Compare the multiplexed WebSocket channel with one request per message.
+
+Starts the API in a uvicorn subprocess with a stand-in engine that streams
+``--tokens`` tokens ``--token-ms`` apart, then simulates ``--users`` users
+each asking ``--messages`` questions, first over ``/ws`` (``--per-socket``
+users share one connection) and then through ``/chat_stream`` NDJSON::
+
+    python -m benchmarks.ws_load --users 1000 --messages 3
+
+For each transport it reports the connections opened, frames received,
+server CPU time (read from ``/proc``, so Linux only) and the time to the
+first token and to the end of each answer.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import websockets
+
+
+class FakeEngine:
+    """ChatEngine stand-in streaming numbered tokens at a fixed pace."""
+
+    def __init__(self, **_kwargs) -> None:
+        self.tokens = int(os.environ.get("BENCH_TOKENS", "50"))
+        self.delay = float(os.environ.get("BENCH_TOKEN_MS", "20")) / 1000.0
+
+    async def stream_async(self, user_input: str, timeout: float = 30.0):
+        for i in range(self.tokens):
+            await asyncio.sleep(self.delay)
+            yield f" t{i}"
+
+    async def generate_async(self, user_input: str, timeout: float = 30.0) -> str:
+        return "".join([t async for t in self.stream_async(user_input)])
+
+    def close(self) -> None:
+        pass
+
+
+def server_app():
+    """uvicorn factory returning the API app with ``FakeEngine``."""
+    from api import app as app_mod
+
+    app_mod.ChatEngine = FakeEngine
+    return app_mod.app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as fh:
+        fields = fh.read().rsplit(")", 1)[1].split()
+    # utime and stime are fields 14 and 15 of the whole line.
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.connections = 0
+        self.frames = 0
+        self.errors = 0
+        self.first_token: list[float] = []
+        self.total: list[float] = []
+
+    def summary(self, name: str, cpu: float, seconds: float) -> dict:
+        return {
+            "transport": name,
+            "connections": self.connections,
+            "frames": self.frames,
+            "answers": len(self.total),
+            "errors": self.errors,
+            "server_cpu_s": round(cpu, 3),
+            "seconds": round(seconds, 3),
+            "first_token_p50_ms": round(_percentile(self.first_token, 0.50), 1),
+            "first_token_p95_ms": round(_percentile(self.first_token, 0.95), 1),
+            "answer_p50_ms": round(_percentile(self.total, 0.50), 1),
+            "answer_p95_ms": round(_percentile(self.total, 0.95), 1),
+        }
+
+
+async def run_ws(url: str, users: int, messages: int, per_socket: int, stats: Stats) -> None:
+    """Ask every user's questions over shared WebSocket connections."""
+
+    async def connection(first_user: int, count: int) -> None:
+        pending: dict[str, asyncio.Queue] = {}
+        async with websockets.connect(url, max_queue=None) as ws:
+            stats.connections += 1
+
+            async def reader() -> None:
+                async for text in ws:
+                    stats.frames += 1
+                    frame = json.loads(text)
+                    queue = pending.get(frame["id"])
+                    if queue is not None:
+                        queue.put_nowait(frame)
+
+            async def user(n: int) -> None:
+                for m in range(messages):
+                    stream_id = f"{n}-{m}"
+                    queue = pending[stream_id] = asyncio.Queue()
+                    start = time.perf_counter()
+                    first = None
+                    await ws.send(
+                        json.dumps({"type": "chat", "id": stream_id, "message": f"question {m}"})
+                    )
+                    while True:
+                        frame = await queue.get()
+                        if frame["type"] == "token" and first is None:
+                            first = time.perf_counter() - start
+                        if frame["type"] in ("done", "error"):
+                            break
+                    del pending[stream_id]
+                    if frame["type"] == "error":
+                        stats.errors += 1
+                        continue
+                    stats.first_token.append((first or 0.0) * 1000.0)
+                    stats.total.append((time.perf_counter() - start) * 1000.0)
+
+            read = asyncio.create_task(reader())
+            try:
+                await asyncio.gather(*(user(first_user + i) for i in range(count)))
+            finally:
+                read.cancel()
+
+    await asyncio.gather(
+        *(
+            connection(start, min(per_socket, users - start))
+            for start in range(0, users, per_socket)
+        )
+    )
+
+
+async def run_http(url: str, users: int, messages: int, stats: Stats) -> None:
+    """Ask every user's questions as separate ``/chat_stream`` requests."""
+
+    async def trace(event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            stats.connections += 1
+
+    async def user(client: httpx.AsyncClient, n: int) -> None:
+        for m in range(messages):
+            start = time.perf_counter()
+            first = None
+            try:
+                async with client.stream(
+                    "POST",
+                    "/chat_stream",
+                    json={"message": f"question {m}"},
+                    headers={"Accept": "application/x-ndjson"},
+                    extensions={"trace": trace},
+                ) as resp:
+                    async for line in resp.aiter_lines():
+                        if not line:
+                            continue
+                        stats.frames += 1
+                        if first is None and '"token"' in line:
+                            first = time.perf_counter() - start
+            except httpx.HTTPError:
+                stats.errors += 1
+                continue
+            stats.first_token.append((first or 0.0) * 1000.0)
+            stats.total.append((time.perf_counter() - start) * 1000.0)
+
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120.0) as client:
+        await asyncio.gather(*(user(client, n) for n in range(users)))
+
+
+def _wait_ready(url: str, proc: subprocess.Popen) -> None:
+    deadline = time.monotonic() + 60.0
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("server exited during startup")
+        try:
+            if httpx.get(url + "/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise SystemExit("server did not start")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=3, help="Questions per user")
+    parser.add_argument("--per-socket", type=int, default=8, help="Users per WebSocket")
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens per answer")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="Delay between tokens")
+    parser.add_argument("--coalesce-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "BENCH_TOKENS": str(args.tokens),
+        "BENCH_TOKEN_MS": str(args.token_ms),
+        "WS_MAX_STREAMS": str(args.per_socket),
+        "WS_COALESCE_MS": str(args.coalesce_ms),
+        "VECTOR_DB_DIR": os.path.join(tempfile.gettempdir(), "civicai-bench-no-db"),
+        "LOG_LEVEL": "WARNING",
+    }
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "benchmarks.ws_load:server_app",
+            "--factory", "--port", str(port), "--log-level", "warning",
+            "--backlog", str(max(2048, args.users * 2)),
+        ],
+        env=env,
+    )
+    try:
+        _wait_ready(url, proc)
+        runs = [
+            ("websocket", lambda s: run_ws(
+                url.replace("http", "ws", 1) + "/ws",
+                args.users, args.messages, args.per_socket, s,
+            )),
+            ("chat_stream", lambda s: run_http(url, args.users, args.messages, s)),
+        ]
+        for name, run in runs:
+            stats = Stats()
+            cpu = _cpu_seconds(proc.pid)
+            start = time.perf_counter()
+            asyncio.run(run(stats))
+            seconds = time.perf_counter() - start
+            print(json.dumps(stats.summary(name, _cpu_seconds(proc.pid) - cpu, seconds)))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Chunking and near-duplicate filtering stages used by ``ingest.py``.
+
+Municipal documents are organized in sections (``Sec. 28.04.010``,
+``Chapter 7``, ``ORDINANCE NO. 5890``, agenda items, Markdown headings), so
+``SectionChunker`` splits on those boundaries first and only falls back to a
+character splitter for sections that are too long. ``NearDuplicateFilter``
+then drops chunks that are near-copies of earlier ones, such as repeated
+agenda notices and page headers, before they are embedded.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, Protocol
+import hashlib
+import re
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+__all__ = [
+    "Chunker",
+    "SectionChunker",
+    "NearDuplicateFilter",
+    "DedupStats",
+    "get_chunker",
+]
+
+_HEADING_RE = re.compile(
+    r"""^(?:
+        \#{1,6}\s+\S                                        # Markdown heading
+      | (?:sec(?:tion)?\.?|§+)\s*\d[\w.\-]*                 # Sec. 28.04.010
+      | (?:chapter|article|title|part|division)\s+[\w.\-]+  # Chapter 28
+      | (?:ordinance|resolution)\s+(?:no\.?\s*)?\d[\w.\-]* # Ordinance No. 5890
+      | (?:agenda\s+)?item\s+(?:no\.?\s*)?\d+               # Item 4
+      | \d+(?:\.\d+)+\s+(?-i:[A-Z])                         # 28.04.010 Definitions
+    )""",
+    re.IGNORECASE | re.VERBOSE,
+)
+_CAPS_HEADING_RE = re.compile(r"^[A-Z][A-Z0-9 ,.&'()\-]{3,79}$")
+_WORD_RE = re.compile(r"\w+")
+
+
+class Chunker(Protocol):
+    """Anything that splits a document into chunks, like LangChain splitters."""
+
+    def split_text(self, text: str) -> list[str]:
+        ...
+
+
+def _is_heading(line: str) -> bool:
+    stripped = line.strip()
+    if not stripped or len(stripped) > 120:
+        return False
+    return bool(_HEADING_RE.match(stripped) or _CAPS_HEADING_RE.match(stripped))
+
+
+class SectionChunker:
+    """Split documents on section, heading and ordinance boundaries.
+
+    Each heading starts a new section; headings without body text are joined
+    to the following section. Sections longer than ``chunk_size`` have their
+    body split with a recursive character splitter into pieces that still fit
+    ``chunk_size`` once the section heading is put back in front of them, so
+    continuation chunks stay attributable. The overlap between pieces follows
+    the heading line, where ``api.context.merge_chunks`` looks for it.
+    """
+
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50) -> None:
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def split_sections(self, text: str) -> list[tuple[str, str]]:
+        """Return ``(heading, section_text)`` pairs in document order."""
+        sections: list[tuple[str, list[str]]] = [("", [])]
+        has_body = False
+        for line in text.splitlines():
+            if _is_heading(line):
+                heading, lines = sections[-1]
+                if lines and not has_body:
+                    # Only headings so far: carry them into this section.
+                    sections[-1] = (line.strip(), lines + [line])
+                else:
+                    sections.append((line.strip(), [line]))
+                has_body = False
+            else:
+                sections[-1][1].append(line)
+                has_body = has_body or bool(line.strip())
+        result = []
+        for heading, lines in sections:
+            body = "\n".join(lines).strip()
+            if body:
+                result.append((heading, body))
+        return result
+
+    def split_with_headings(self, text: str) -> list[tuple[str, str]]:
+        """Return ``(section heading, chunk)`` pairs in document order."""
+        chunks: list[tuple[str, str]] = []
+        for heading, section in self.split_sections(text):
+            if len(section) <= self.chunk_size:
+                chunks.append((heading, section))
+                continue
+            # Everything up to the heading line (headings carried into this
+            # section, or the document preamble) leads the first piece only.
+            lead, _, body = section.partition(heading) if heading else ("", "", section)
+            lead = f"{lead}{heading}".strip()
+            size = max(self.chunk_size - len(lead) - 1, self.chunk_size // 2)
+            splitter = RecursiveCharacterTextSplitter(
+                chunk_size=size, chunk_overlap=min(self.chunk_overlap, size // 2)
+            )
+            for i, piece in enumerate(splitter.split_text(body.strip())):
+                prefix = lead if i == 0 else heading
+                chunks.append((heading, f"{prefix}\n{piece}" if prefix else piece))
+        return chunks
+
+    def split_text(self, text: str) -> list[str]:
+        return [chunk for _heading, chunk in self.split_with_headings(text)]
+
+
+def get_chunker(name: str, chunk_size: int = 500, chunk_overlap: int = 50) -> Chunker:
+    """Return the chunker registered under ``name`` (``sections`` or ``recursive``)."""
+    if name == "sections":
+        return SectionChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    if name == "recursive":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        )
+    raise ValueError(f"unknown chunker: {name!r}")
+
+
+@dataclass
+class DedupStats:
+    """Counts reported by ``NearDuplicateFilter.filter``."""
+
+    chunks_in: int = 0
+    chunks_out: int = 0
+    chars_in: int = 0
+    chars_out: int = 0
+
+    @property
+    def reduction(self) -> float:
+        """Fraction of characters removed before embedding."""
+        return 1.0 - self.chars_out / self.chars_in if self.chars_in else 0.0
+
+
+class NearDuplicateFilter:
+    """Drop chunks whose MinHash signature matches an earlier chunk.
+
+    Chunks are represented by their word ``shingle_size``-grams. Signatures
+    of ``num_perm`` hash functions are bucketed with LSH in ``bands`` bands,
+    and candidates whose estimated Jaccard similarity reaches ``threshold``
+    are treated as duplicates of the first chunk seen.
+    """
+
+    _PRIME = (1 << 31) - 1
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 5,
+        seed: int = 1,
+    ) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, self._PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, self._PRIME, size=(num_perm, 1), dtype=np.uint64)
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        words = _WORD_RE.findall(text.lower())
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {
+            " ".join(words[i : i + size]) for i in range(max(len(words) - size + 1, 1))
+        }
+        return np.fromiter(
+            (
+                int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little")
+                & self._PRIME
+                for s in shingles
+            ),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        """Return the MinHash signature of ``text``."""
+        hashes = self._shingle_hashes(text)
+        return ((self._a * hashes + self._b) % self._PRIME).min(axis=1)
+
+    def filter(self, chunks: Iterable[str]) -> tuple[list[str], DedupStats]:
+        """Return the chunks that are not near-duplicates and the counts."""
+        chunks = list(chunks)
+        keep, stats = self.select(chunks)
+        return [chunks[i] for i in keep], stats
+
+    def select(self, chunks: Iterable[str]) -> tuple[list[int], DedupStats]:
+        """Return the positions of chunks that are not near-duplicates."""
+        stats = DedupStats()
+        kept: list[int] = []
+        signatures: list[np.ndarray] = []
+        buckets: dict[tuple[int, bytes], list[int]] = {}
+        for position, chunk in enumerate(chunks):
+            stats.chunks_in += 1
+            stats.chars_in += len(chunk)
+            sig = self.signature(chunk)
+            keys = [
+                (band, sig[band * self.rows : (band + 1) * self.rows].tobytes())
+                for band in range(self.bands)
+            ]
+            candidates = {i for key in keys for i in buckets.get(key, ())}
+            if any(
+                float(np.mean(signatures[i] == sig)) >= self.threshold
+                for i in candidates
+            ):
+                continue
+            index = len(kept)
+            kept.append(position)
+            signatures.append(sig)
+            for key in keys:
+                buckets.setdefault(key, []).append(index)
+            stats.chunks_out += 1
+            stats.chars_out += len(chunk)
+        return kept, stats
@@ -0,0 +1,251 @@
+"""Offline retrieval evaluation for tuning chunking and ``k``.
+
+Sweeps chunkers, chunk sizes, overlaps and ``k`` over a corpus directory and
+scores retrieval against a labeled JSONL file with one
+``{"question": ..., "sources": ["file.txt", ...]}`` object per line. A
+hashing embedder stands in for the real embedding model so the sweep runs
+offline and in seconds; absolute scores are lower than with a neural model
+but the relative effect of each parameter is usually preserved.
+
+Run from the repository root::
+
+    python3 -m data.evaluate --data-dir data/santa_barbara \\
+        --labels data/santa_barbara_eval.jsonl --chunk-sizes 200,500,1000
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+import argparse
+import itertools
+import json
+import re
+import time
+import zlib
+
+import numpy as np
+
+from api.context import estimate_tokens, pack_context
+from data.chunking import NearDuplicateFilter, get_chunker
+from data.ingest import DEFAULT_DATA_DIR, load_named_documents
+
+__all__ = ["HashingEmbeddings", "Chunk", "build_chunks", "evaluate", "sweep"]
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class HashingEmbeddings:
+    """Deterministic bag-of-words embeddings for offline evaluation.
+
+    Word unigrams and bigrams are hashed into ``dim`` signed buckets with
+    sublinear term frequency and the result is L2-normalized.
+    """
+
+    def __init__(self, dim: int = 1024) -> None:
+        self.dim = dim
+
+    def _features(self, text: str) -> list[str]:
+        words = _TOKEN_RE.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts: list[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                matrix[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+@dataclass
+class Chunk:
+    """A chunk of text and the file it came from."""
+
+    page_content: str
+    source: str
+
+    @property
+    def metadata(self) -> dict:
+        return {"source": self.source}
+
+
+def build_chunks(
+    documents: list[tuple[str, str]],
+    chunker: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    dedup_threshold: float = 0.85,
+) -> list[Chunk]:
+    """Split named ``documents`` the way ``ingest.py`` would."""
+    splitter = get_chunker(chunker, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = [
+        Chunk(text, name)
+        for name, document in documents
+        for text in splitter.split_text(document)
+    ]
+    if dedup_threshold > 0:
+        keep, _stats = NearDuplicateFilter(threshold=dedup_threshold).select(
+            c.page_content for c in chunks
+        )
+        chunks = [chunks[i] for i in keep]
+    return chunks
+
+
+def evaluate(
+    chunks: list[Chunk],
+    labels: list[dict],
+    ks: list[int],
+    embeddings: HashingEmbeddings,
+    token_budget: int = 1000,
+) -> list[dict]:
+    """Return one metrics row per ``k`` for retrieving ``labels`` from ``chunks``.
+
+    ``recall`` is the fraction of expected sources found in the top ``k``
+    chunks, ``mrr`` the mean reciprocal rank of the first relevant chunk,
+    ``tokens`` the mean packed context size and ``latency_ms`` the mean time
+    to embed a question and search the chunks. An empty corpus scores zero;
+    ``ValueError`` is raised when there are no labeled questions or ``ks``.
+    """
+    if not labels:
+        raise ValueError("no labeled questions to evaluate")
+    if not ks:
+        raise ValueError("no k values to evaluate")
+    matrix = embeddings.embed_documents([c.page_content for c in chunks])
+    max_k = min(max(ks), len(chunks))
+    rankings = []
+    latencies = []
+    for label in labels:
+        start = time.perf_counter()
+        query = np.asarray(embeddings.embed_query(label["question"]))
+        top = []
+        if max_k > 0:
+            scores = matrix @ query
+            top = np.argpartition(-scores, max_k - 1)[:max_k]
+            top = top[np.argsort(-scores[top])]
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        rankings.append([chunks[i] for i in top])
+
+    rows = []
+    for k in ks:
+        recall = mrr = tokens = 0.0
+        for label, ranking in zip(labels, rankings):
+            expected = set(label["sources"])
+            retrieved = ranking[:k]
+            found = {c.source for c in retrieved} & expected
+            recall += len(found) / len(expected)
+            for rank, chunk in enumerate(retrieved, start=1):
+                if chunk.source in expected:
+                    mrr += 1.0 / rank
+                    break
+            tokens += estimate_tokens(pack_context(retrieved, token_budget))
+        n = len(labels)
+        rows.append(
+            {
+                "k": k,
+                "recall": recall / n,
+                "mrr": mrr / n,
+                "tokens": tokens / n,
+                "latency_ms": sum(latencies) / n,
+            }
+        )
+    return rows
+
+
+def sweep(
+    data_dir: Path,
+    labels: list[dict],
+    chunkers: list[str],
+    chunk_sizes: list[int],
+    overlaps: list[int],
+    ks: list[int],
+    token_budget: int = 1000,
+) -> list[dict]:
+    """Evaluate every combination of chunking parameters and ``k``."""
+    documents = load_named_documents(data_dir)
+    embeddings = HashingEmbeddings()
+    results = []
+    for chunker, size, overlap in itertools.product(chunkers, chunk_sizes, overlaps):
+        if overlap >= size:
+            continue
+        chunks = build_chunks(documents, chunker, size, overlap)
+        for row in evaluate(chunks, labels, ks, embeddings, token_budget):
+            results.append(
+                {
+                    "chunker": chunker,
+                    "chunk_size": size,
+                    "overlap": overlap,
+                    "chunks": len(chunks),
+                    **row,
+                }
+            )
+    return results
+
+
+def format_table(rows: list[dict]) -> str:
+    header = (
+        f"{'chunker':<10} {'size':>5} {'overlap':>7} {'chunks':>6} {'k':>3} "
+        f"{'recall@k':>8} {'MRR':>6} {'tokens':>7} {'ms':>7}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        lines.append(
+            f"{r['chunker']:<10} {r['chunk_size']:>5} {r['overlap']:>7} "
+            f"{r['chunks']:>6} {r['k']:>3} {r['recall']:>8.3f} {r['mrr']:>6.3f} "
+            f"{r['tokens']:>7.0f} {r['latency_ms']:>7.3f}"
+        )
+    return "\n".join(lines)
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def _cli() -> None:
+    parser = argparse.ArgumentParser(
+        description="Sweep chunking parameters and k against labeled questions"
+    )
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR)
+    parser.add_argument(
+        "--labels",
+        type=Path,
+        default=Path(__file__).parent / "santa_barbara_eval.jsonl",
+        help="JSONL file of {question, sources} objects",
+    )
+    parser.add_argument("--chunkers", default="sections,recursive")
+    parser.add_argument("--chunk-sizes", type=_int_list, default=[250, 500, 1000])
+    parser.add_argument("--overlaps", type=_int_list, default=[0, 50, 100])
+    parser.add_argument("--ks", type=_int_list, default=[1, 3, 5, 8])
+    parser.add_argument("--token-budget", type=int, default=1000)
+    parser.add_argument("--json", action="store_true", help="Print JSON lines")
+    args = parser.parse_args()
+
+    with args.labels.open(encoding="utf-8") as fh:
+        labels = [json.loads(line) for line in fh if line.strip()]
+    try:
+        rows = sweep(
+            args.data_dir,
+            labels,
+            args.chunkers.split(","),
+            args.chunk_sizes,
+            args.overlaps,
+            args.ks,
+            args.token_budget,
+        )
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.json:
+        for row in rows:
+            print(json.dumps(row))
+    else:
+        print(format_table(rows))
+
+
+if __name__ == "__main__":
+    _cli()
@@ -0,0 +1,350 @@
+"""Extract plain text from the document formats cities publish.
+
+``extract_documents`` turns ``.txt``, ``.md``, ``.html``, ``.pdf`` and
+``.docx`` files into text for chunking. Plain text is read directly; the
+other formats are parsed in a pool of worker processes so a large corpus
+uses every core. Each worker limits its address space and each file gets a
+time budget, past which a stuck worker is killed, so one malformed PDF
+cannot stall or exhaust the machine.
+
+Extracted text is cached under the hash of the file contents, so
+re-ingesting a directory only parses files that changed. PDF support needs
+the optional ``pypdf`` package.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Iterable
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import zipfile
+from xml.etree import ElementTree
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # optional dependency
+    PdfReader = None
+
+try:
+    from api.utils import html_to_text
+except ImportError:  # executed as a script: ``python data/ingest.py``
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from api.utils import html_to_text
+
+__all__ = [
+    "SUPPORTED_SUFFIXES",
+    "ExtractionError",
+    "extract_text",
+    "extract_documents",
+    "file_digest",
+]
+
+logger = logging.getLogger(__name__)
+
+# Bump when an extractor changes so cached text is re-extracted.
+EXTRACTOR_VERSION = 2
+# Seconds past the per-file timeout before the parent kills a worker whose
+# alarm could not interrupt it (for example inside zlib or a C parser).
+_KILL_GRACE = 5.0
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+class ExtractionError(Exception):
+    """Raised when a file cannot be turned into text."""
+
+
+def _read_text(path: Path) -> str:
+    return path.read_bytes().decode("utf-8", errors="replace")
+
+
+def _extract_html(path: Path) -> str:
+    return html_to_text(_read_text(path), keep_lines=True)
+
+
+def _extract_pdf(path: Path) -> str:
+    if PdfReader is None:
+        raise ExtractionError("pypdf is not installed")
+    try:
+        reader = PdfReader(str(path))
+        pages = [page.extract_text() or "" for page in reader.pages]
+    except Exception as exc:
+        raise ExtractionError(f"unreadable PDF: {exc}") from exc
+    return "\n\n".join(page.strip() for page in pages if page.strip())
+
+
+def _extract_docx(path: Path) -> str:
+    """Return the paragraphs of a Word document; headings become Markdown headings."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            root = ElementTree.fromstring(archive.read("word/document.xml"))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as exc:
+        raise ExtractionError(f"unreadable DOCX: {exc}") from exc
+    paragraphs = []
+    for para in root.iter(f"{_W}p"):
+        parts = []
+        for node in para.iter():
+            if node.tag == f"{_W}t":
+                parts.append(node.text or "")
+            elif node.tag == f"{_W}tab":
+                parts.append("\t")
+            elif node.tag in (f"{_W}br", f"{_W}cr"):
+                parts.append("\n")
+        text = "".join(parts).strip()
+        if not text:
+            continue
+        style = para.find(f"{_W}pPr/{_W}pStyle")
+        name = style.get(f"{_W}val", "") if style is not None else ""
+        if name.lower().startswith("heading"):
+            level = name[7:].strip()
+            text = "#" * (int(level) if level.isdigit() else 1) + " " + text
+        paragraphs.append(text)
+    return "\n\n".join(paragraphs)
+
+
+EXTRACTORS: dict[str, Callable[[Path], str]] = {
+    ".txt": _read_text,
+    ".md": _read_text,
+    ".html": _extract_html,
+    ".htm": _extract_html,
+    ".pdf": _extract_pdf,
+    ".docx": _extract_docx,
+}
+SUPPORTED_SUFFIXES = frozenset(EXTRACTORS)
+# Formats cheap enough to read in the calling process.
+_INLINE_SUFFIXES = frozenset({".txt", ".md"})
+
+
+def extract_text(path: Path) -> str:
+    """Return the text of ``path`` using the extractor for its suffix."""
+    extractor = EXTRACTORS.get(path.suffix.lower())
+    if extractor is None:
+        raise ExtractionError(f"unsupported file type {path.suffix!r}")
+    return extractor(path)
+
+
+def file_digest(path: Path) -> str:
+    """Return the SHA-256 of the contents of ``path`` and the extractor version."""
+    digest = hashlib.sha256(f"{EXTRACTOR_VERSION}:{path.suffix.lower()}:".encode())
+    with path.open("rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _limit_memory(megabytes: int) -> None:
+    """Pool initializer: let each extraction allocate at most ``megabytes`` more."""
+    if resource is None or not megabytes:
+        return
+    limit = megabytes * 1024 * 1024
+    try:
+        with open("/proc/self/statm") as fh:
+            limit += int(fh.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError):
+        pass
+    _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _on_alarm(signum, frame):
+    raise TimeoutError
+
+
+_started = None
+
+
+def _init_worker(megabytes: int, started) -> None:
+    """Pool initializer: limit memory and remember where to report started files."""
+    global _started
+    _started = started
+    _limit_memory(megabytes)
+
+
+def _extract_worker(path: Path, timeout: float) -> tuple[str | None, str | None]:
+    """Return ``(text, None)`` or ``(None, error)``; runs in a pool worker."""
+    if _started is not None:
+        _started.put((str(path), os.getpid()))
+    timer = timeout > 0 and hasattr(signal, "setitimer")
+    if timer:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return extract_text(path), None
+    except TimeoutError:
+        return None, f"timed out after {timeout:g}s"
+    except MemoryError:
+        return None, "memory limit exceeded"
+    except (ExtractionError, OSError) as exc:
+        return None, str(exc)
+    except Exception as exc:
+        return None, f"{type(exc).__name__}: {exc}"
+    finally:
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _pool_round(
+    paths: list[Path], workers: int, timeout: float, memory_mb: int
+) -> tuple[dict[Path, tuple[str | None, str | None]], list[Path]]:
+    """Extract ``paths`` in one pool until done or the pool breaks.
+
+    Workers report each file they start; a file still running ``timeout``
+    plus ``_KILL_GRACE`` seconds later fails and its worker is killed,
+    which breaks the pool. Returns the results so far and, if the pool
+    broke on its own, the started files one of which crashed it.
+    """
+    # ``spawn`` keeps workers clean when ingest runs inside the threaded API server.
+    context = multiprocessing.get_context("spawn")
+    started_queue = context.SimpleQueue()
+    by_name = {str(path): path for path in paths}
+    results: dict[Path, tuple[str | None, str | None]] = {}
+    started: dict[Path, tuple[int, float]] = {}
+    killed = broken = False
+    pool = ProcessPoolExecutor(
+        max_workers=min(workers, len(paths)),
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(memory_mb, started_queue),
+    )
+    try:
+        futures = {pool.submit(_extract_worker, path, timeout): path for path in paths}
+        pending = set(futures)
+        while pending and not broken:
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    results.setdefault(futures[future], future.result())
+                except BrokenProcessPool:
+                    broken = True
+            while not started_queue.empty():
+                name, pid = started_queue.get()
+                started[by_name[name]] = (pid, time.monotonic())
+            if timeout <= 0:
+                continue
+            now = time.monotonic()
+            for path, (pid, at) in started.items():
+                if path not in results and now - at > timeout + _KILL_GRACE:
+                    results[path] = (None, f"timed out after {timeout:g}s")
+                    killed = True
+                    try:
+                        os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+                    except OSError:
+                        pass
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    crashed = []
+    if broken and not killed:
+        crashed = [path for path in started if path not in results]
+    return results, crashed
+
+
+def _run_pool(
+    paths: list[Path], workers: int, timeout: float, memory_mb: int
+) -> dict[Path, tuple[str | None, str | None]]:
+    """Extract ``paths`` in worker processes and return the result of each.
+
+    A pool broken by a crashed or killed worker is rebuilt for the files it
+    had not finished; when several files were running during a crash, each
+    is retried in its own process so only the culprit fails.
+    """
+    results: dict[Path, tuple[str | None, str | None]] = {}
+    remaining = list(paths)
+    while remaining:
+        found, crashed = _pool_round(remaining, workers, timeout, memory_mb)
+        results.update(found)
+        for path in crashed:
+            if len(crashed) > 1:
+                results.update(_pool_round([path], 1, timeout, memory_mb)[0])
+            results.setdefault(path, (None, "extractor process crashed"))
+        left = [path for path in remaining if path not in results]
+        if len(left) == len(remaining):
+            # The pool broke before any file finished, e.g. workers failing to start.
+            for path in left:
+                results[path] = (None, "extractor process crashed")
+            break
+        remaining = left
+    return results
+
+
+def extract_documents(
+    paths: Iterable[Path],
+    cache_dir: Path | None = None,
+    workers: int | None = None,
+    timeout: float = 60.0,
+    memory_mb: int = 1024,
+) -> tuple[list[tuple[Path, str]], dict]:
+    """Return ``(path, text)`` for every supported file in ``paths`` that has text.
+
+    HTML, PDF and DOCX files are parsed by ``workers`` processes (default:
+    one per CPU), each file within ``timeout`` seconds and ``memory_mb``
+    megabytes. With ``cache_dir`` extracted text is stored by file hash and
+    reused on the next call; entries for files no longer present are
+    removed. Files that fail are logged and skipped. The report counts the
+    ``files`` seen, those ``extracted`` and ``cached``, and lists ``failed``
+    file names with their reasons.
+    """
+    started = time.perf_counter()
+    paths = [Path(p) for p in paths if Path(p).suffix.lower() in SUPPORTED_SUFFIXES]
+    texts: dict[Path, str] = {}
+    failed: dict[str, str] = {}
+    digests: dict[Path, str] = {}
+    todo: list[Path] = []
+    cached = 0
+    for path in paths:
+        if path.suffix.lower() in _INLINE_SUFFIXES:
+            texts[path] = _read_text(path)
+            continue
+        if cache_dir is not None:
+            digests[path] = file_digest(path)
+            entry = cache_dir / f"{digests[path]}.txt"
+            if entry.exists():
+                texts[path] = entry.read_text(encoding="utf-8")
+                cached += 1
+                continue
+        todo.append(path)
+
+    if todo:
+        results = _run_pool(todo, workers or os.cpu_count() or 1, timeout, memory_mb)
+        for path in todo:
+            text, error = results[path]
+            if error is not None:
+                logger.warning("Skipping %s: %s", path.name, error)
+                failed[path.name] = error
+                continue
+            texts[path] = text
+            if cache_dir is not None:
+                cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp = cache_dir / f"{digests[path]}.tmp"
+                tmp.write_text(text, encoding="utf-8")
+                os.replace(tmp, cache_dir / f"{digests[path]}.txt")
+
+    if cache_dir is not None and cache_dir.exists():
+        keep = {f"{digest}.txt" for digest in digests.values()}
+        for entry in cache_dir.glob("*.txt"):
+            if entry.name not in keep:
+                entry.unlink(missing_ok=True)
+
+    documents = [(path, texts[path]) for path in paths if texts.get(path, "").strip()]
+    report = {
+        "files": len(paths),
+        "extracted": len(todo) - len(failed),
+        "cached": cached,
+        "failed": failed,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    return documents, report
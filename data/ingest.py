@@ -1,69 +1,402 @@
-"""Ingest text documents into a local Chroma vector store."""
+"""Ingest city documents into a local Chroma vector store."""
 
+from contextlib import contextmanager
+from datetime import date, datetime
 from pathlib import Path
 import os
 import argparse
+import json
 import logging
+import re
+import shutil
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import numpy as np
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+try:
+    from .chunking import NearDuplicateFilter, get_chunker
+    from .extract import SUPPORTED_SUFFIXES, extract_documents
+except ImportError:  # executed as a script: ``python data/ingest.py``
+    from chunking import NearDuplicateFilter, get_chunker
+    # Also puts the repository root on ``sys.path`` for the ``api`` imports.
+    from extract import SUPPORTED_SUFFIXES, extract_documents
+
+from api.cache import CachedEmbeddings
+from api.embeddings import get_embeddings
+from api.vector_index import (
+    CATEGORY_CODES_FILE,
+    CATEGORY_NAMES_FILE,
+    GENERATION_FILE,
+    SHARED_INDEX_DIR,
+    encode_categories,
+    read_generation,
+)
 
 
 DEFAULT_DATA_DIR = Path(__file__).parent / "santa_barbara"
+DEFAULT_TENANTS_DIR = Path(__file__).parent
 DEFAULT_DB_DIR = Path(__file__).parent.parent / "vector_db"
 
+# Held while a shared index is exported so concurrent ingests of one
+# city take consecutive generations.
+EXPORT_LOCK_FILE = ".export.lock"
+# Text extracted from HTML, PDF and DOCX files, keyed by file hash.
+EXTRACT_CACHE_DIR = "extract_cache"
+
+# Document categories inferred from file names; ``api.filters`` maps
+# questions onto the same names.
+CATEGORY_KEYWORDS = {
+    "trash": ("trash", "waste", "recycl", "garbage", "refuse"),
+    "permits": ("permit",),
+    "zoning": ("zoning", "zone", "land_use", "planning"),
+    "council": ("council", "agenda", "minutes", "ordinance", "resolution"),
+}
+DEFAULT_CATEGORY = "general"
+
+_DATE_RE = re.compile(
+    r"\b(\d{4}-\d{2}-\d{2})\b"
+    r"|\b((?:January|February|March|April|May|June|July|August|September"
+    r"|October|November|December)\s+\d{1,2},\s+\d{4})\b"
+)
+
 logger = logging.getLogger(__name__)
 
 
+def document_paths(data_dir: Path) -> list[Path]:
+    """Return the files in ``data_dir`` that ingest can read, sorted by name."""
+    return sorted(
+        path
+        for path in data_dir.iterdir()
+        if path.is_file() and path.suffix.lower() in SUPPORTED_SUFFIXES
+    )
+
+
+def load_named_documents(data_dir: Path, **options) -> list[tuple[str, str]]:
+    """Return ``(file name, text)`` for all supported documents sorted by name.
+
+    ``options`` are passed to ``extract_documents``.
+    """
+    documents, _report = extract_documents(document_paths(data_dir), **options)
+    return [(path.name, text) for path, text in documents]
+
+
 def load_documents(data_dir: Path) -> list[str]:
-    """Return the UTF-8 contents of all ``*.txt`` files sorted by name."""
-    texts: list[str] = []
-    for path in sorted(data_dir.glob("*.txt")):
-        texts.append(path.read_text(encoding="utf-8"))
-    return texts
-
-
-def get_embeddings():
-    """Return an embeddings backend, preferring OpenAI when available."""
-    try:
-        return OpenAIEmbeddings(model="text-embedding-3-small")
-    except Exception:
-        model_dir = Path(__file__).parent.parent / "models" / "bge-small-en"
-        if model_dir.exists():
-            return HuggingFaceEmbeddings(model_name=str(model_dir))
-        return HuggingFaceEmbeddings(model_name="BAAI/bge-small-en")
-
-
-def ingest(data_dir: Path, db_dir: Path) -> None:
-    """Process ``data_dir`` and write embeddings to ``db_dir``."""
+    """Return the text of all supported documents sorted by name."""
+    return [text for _name, text in load_named_documents(data_dir)]
+
+
+def infer_category(name: str) -> str:
+    """Return the category of a document from keywords in its file name."""
+    stem = Path(name).stem.lower()
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        if any(keyword in stem for keyword in keywords):
+            return category
+    return DEFAULT_CATEGORY
+
+
+def document_date(path: Path, text: str) -> str:
+    """Return the first date in ``text`` or the file's modification date.
+
+    Dates are returned as ``YYYY-MM-DD`` strings.
+    """
+    for match in _DATE_RE.finditer(text):
+        iso, long_form = match.groups()
+        try:
+            if iso:
+                return date.fromisoformat(iso).isoformat()
+            return datetime.strptime(long_form, "%B %d, %Y").date().isoformat()
+        except ValueError:
+            continue
+    return date.fromtimestamp(path.stat().st_mtime).isoformat()
+
+
+def document_metadata(path: Path, text: str) -> dict:
+    """Return the ``source``, ``category`` and ``date`` metadata of a document."""
+    return {
+        "source": path.name,
+        "category": infer_category(path.name),
+        "date": document_date(path, text),
+    }
+
+
+@contextmanager
+def _export_lock(db_dir: Path):
+    """Hold an exclusive lock on ``db_dir`` across processes where supported."""
+    db_dir.mkdir(parents=True, exist_ok=True)
+    with open(db_dir / EXPORT_LOCK_FILE, "a") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return symmetric int8 codes and per-vector float32 scales for ``vectors``.
+
+    ``codes[i] * scales[i]`` approximates ``vectors[i]``.
+    """
+    peak = np.abs(vectors).max(axis=1) if len(vectors) else np.zeros(0)
+    scales = (peak / 127.0).astype(np.float32)
+    safe = np.where(scales == 0, 1.0, scales)[:, None]
+    codes = np.clip(np.rint(vectors / safe), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def export_shared_index(vectordb: Chroma, db_dir: Path) -> int:
+    """Export ``vectordb`` for memory-mapped sharing and bump the generation.
+
+    The normalized float32 embeddings, float16 and int8 (one scale per
+    vector) copies of them, the JSON-encoded chunk records, their byte
+    offsets and a category code per chunk are written to
+    ``shared_index/<generation>/``. Only once the files are complete is
+    ``GENERATION`` replaced atomically, so API workers never observe a
+    partially written index. Exports older than the previous generation are
+    removed. Concurrent exports to one ``db_dir`` run one at a time. Returns
+    the new generation.
+    """
+    data = vectordb.get(include=["embeddings", "documents", "metadatas"])
+    vectors = np.asarray(data["embeddings"], dtype=np.float32).reshape(
+        len(data["documents"]), -1
+    )
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    records = [
+        json.dumps({"text": text, "metadata": meta or {}}).encode("utf-8")
+        for text, meta in zip(data["documents"], data["metadatas"])
+    ]
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in records], out=offsets[1:])
+
+    quantized, scales = quantize_int8(vectors)
+    categories, category_names = encode_categories(data["metadatas"])
+
+    with _export_lock(db_dir):
+        generation = read_generation(db_dir) + 1
+        root = db_dir / SHARED_INDEX_DIR
+        target = root / str(generation)
+        shutil.rmtree(target, ignore_errors=True)
+        target.mkdir(parents=True)
+        np.save(target / "embeddings.npy", vectors)
+        np.save(target / "embeddings_float16.npy", vectors.astype(np.float16))
+        np.save(target / "embeddings_int8.npy", quantized)
+        np.save(target / "scales_int8.npy", scales)
+        np.save(target / "offsets.npy", offsets)
+        (target / "chunks.bin").write_bytes(b"".join(records))
+        np.save(target / CATEGORY_CODES_FILE, categories)
+        (target / CATEGORY_NAMES_FILE).write_text(json.dumps(category_names))
+
+        tmp = db_dir / (GENERATION_FILE + ".tmp")
+        tmp.write_text(str(generation))
+        os.replace(tmp, db_dir / GENERATION_FILE)
+        for old in root.iterdir():
+            if old.name.isdigit() and int(old.name) < generation - 1:
+                shutil.rmtree(old, ignore_errors=True)
+    return generation
+
+
+def split_documents(
+    documents: list[str],
+    metadatas: list[dict],
+    chunker: str = "sections",
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    dedup_threshold: float = 0.85,
+) -> tuple[list[str], list[dict], dict]:
+    """Split ``documents`` and drop near-duplicate chunks.
+
+    Every chunk inherits the metadata of its document plus the ``section``
+    heading it was found under (empty for the ``recursive`` chunker). Returns
+    the chunks to embed, their metadata and a report with the number of
+    chunks before and after de-duplication and the fraction of text removed.
+    A ``dedup_threshold`` of ``0`` disables the near-duplicate filter.
+    """
+    splitter = get_chunker(chunker, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks: list[str] = []
+    chunk_metadatas: list[dict] = []
+    for doc, metadata in zip(documents, metadatas):
+        if hasattr(splitter, "split_with_headings"):
+            pieces = splitter.split_with_headings(doc)
+        else:
+            pieces = [("", piece) for piece in splitter.split_text(doc)]
+        for heading, piece in pieces:
+            chunks.append(piece)
+            chunk_metadatas.append({**metadata, "section": heading})
+    report = {"documents": len(documents), "chunks": len(chunks), "duplicates": 0}
+    if dedup_threshold > 0:
+        keep, stats = NearDuplicateFilter(threshold=dedup_threshold).select(chunks)
+        chunks = [chunks[i] for i in keep]
+        chunk_metadatas = [chunk_metadatas[i] for i in keep]
+        report.update(
+            chunks=stats.chunks_out,
+            duplicates=stats.chunks_in - stats.chunks_out,
+            reduction=round(stats.reduction, 4),
+        )
+    else:
+        report["reduction"] = 0.0
+    return chunks, chunk_metadatas, report
+
+
+def chunk_documents(
+    documents: list[str],
+    chunker: str = "sections",
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    dedup_threshold: float = 0.85,
+) -> tuple[list[str], dict]:
+    """Split ``documents`` like ``split_documents`` without tracking metadata."""
+    chunks, _metadatas, report = split_documents(
+        documents,
+        [{} for _ in documents],
+        chunker=chunker,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        dedup_threshold=dedup_threshold,
+    )
+    return chunks, report
+
+
+def ingest(
+    data_dir: Path,
+    db_dir: Path,
+    chunker: str = "sections",
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    dedup_threshold: float = 0.85,
+    workers: int | None = None,
+    extract_timeout: float = 60.0,
+    extract_memory_mb: int = 1024,
+    embeddings: Embeddings | None = None,
+) -> dict:
+    """Process ``data_dir`` and write embeddings to ``db_dir``.
+
+    Text, Markdown, HTML, PDF and DOCX files are extracted by ``workers``
+    processes (see ``extract_documents``) with a per-file time and memory
+    budget; extracted text is cached in ``db_dir`` so unchanged files are
+    not parsed again. Each chunk is stored with its ``source`` file name,
+    ``section`` heading, ``category`` and ``date`` as metadata. Chunks are
+    embedded with ``embeddings``, by default the model the API shares
+    (``api.embeddings.get_embeddings``). Returns the chunking report from
+    ``split_documents`` with the extraction report and the new index
+    generation added.
+    """
     data_dir = data_dir.expanduser()
     db_dir = db_dir.expanduser()
     if not data_dir.exists():
         raise FileNotFoundError(f"{data_dir} does not exist")
 
     logger.info("Ingesting documents from %s", data_dir)
-    documents = load_documents(data_dir)
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks: list[str] = []
-    for doc in documents:
-        chunks.extend(splitter.split_text(doc))
+    extracted, extraction = extract_documents(
+        document_paths(data_dir),
+        cache_dir=db_dir / EXTRACT_CACHE_DIR,
+        workers=workers,
+        timeout=extract_timeout,
+        memory_mb=extract_memory_mb,
+    )
+    logger.info(
+        "Extracted %d of %d files (%d from cache, %d failed) in %.1fs",
+        extraction["extracted"] + extraction["cached"],
+        extraction["files"],
+        extraction["cached"],
+        len(extraction["failed"]),
+        extraction["seconds"],
+    )
+    chunks, metadatas, report = split_documents(
+        [text for _path, text in extracted],
+        [document_metadata(path, text) for path, text in extracted],
+        chunker=chunker,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        dedup_threshold=dedup_threshold,
+    )
+    logger.info(
+        "Split %d documents into %d chunks, dropped %d near-duplicates "
+        "(%.1f%% of text)",
+        report["documents"],
+        report["chunks"] + report["duplicates"],
+        report["duplicates"],
+        report["reduction"] * 100,
+    )
 
-    embeddings = get_embeddings()
+    if embeddings is None:
+        embeddings = get_embeddings()
+    if isinstance(embeddings, CachedEmbeddings):
+        # Chunk vectors would only push recent questions out of the cache.
+        embeddings = embeddings.inner
     vectordb = Chroma(persist_directory=str(db_dir), embedding_function=embeddings)
     ids = [str(i) for i in range(len(chunks))]
-    vectordb.add_texts(chunks, ids=ids)
+    stale = set(vectordb.get(include=[])["ids"]) - set(ids)
+    if stale:
+        vectordb.delete(ids=sorted(stale))
+    vectordb.add_texts(chunks, metadatas=metadatas, ids=ids)
     vectordb.persist()
-    logger.info("Ingested %d chunks into %s", len(chunks), db_dir)
+    generation = export_shared_index(vectordb, db_dir)
+    logger.info(
+        "Ingested %d chunks into %s (generation %d)", len(chunks), db_dir, generation
+    )
+    report["extraction"] = extraction
+    report["generation"] = generation
+    return report
 
 
-def main(data_dir: Path | None = None, db_dir: Path | None = None) -> None:
+def _env_options() -> dict:
+    """Return chunking and extraction options set through environment variables."""
+    options: dict = {}
+    if os.getenv("CHUNKER"):
+        options["chunker"] = os.environ["CHUNKER"]
+    if os.getenv("CHUNK_SIZE"):
+        options["chunk_size"] = int(os.environ["CHUNK_SIZE"])
+    if os.getenv("CHUNK_OVERLAP"):
+        options["chunk_overlap"] = int(os.environ["CHUNK_OVERLAP"])
+    if os.getenv("DEDUP_THRESHOLD"):
+        options["dedup_threshold"] = float(os.environ["DEDUP_THRESHOLD"])
+    if os.getenv("EXTRACT_WORKERS"):
+        options["workers"] = int(os.environ["EXTRACT_WORKERS"])
+    if os.getenv("EXTRACT_TIMEOUT"):
+        options["extract_timeout"] = float(os.environ["EXTRACT_TIMEOUT"])
+    if os.getenv("EXTRACT_MEMORY_MB"):
+        options["extract_memory_mb"] = int(os.environ["EXTRACT_MEMORY_MB"])
+    return options
+
+
+def main(
+    data_dir: Path | None = None,
+    db_dir: Path | None = None,
+    city: str | None = None,
+    **options,
+) -> dict:
+    """Run ingestion using CLI arguments, environment variables or defaults.
+
+    When ``city`` is given the documents are read from
+    ``$TENANTS_DATA_DIR/<city>`` and the store is written to
+    ``$VECTOR_DB_DIR/<city>`` unless explicit directories are passed.
+    ``options`` are passed to ``ingest`` and override the ``CHUNKER``,
+    ``CHUNK_SIZE``, ``CHUNK_OVERLAP``, ``DEDUP_THRESHOLD``,
+    ``EXTRACT_WORKERS``, ``EXTRACT_TIMEOUT`` and ``EXTRACT_MEMORY_MB``
+    variables.
+    """
+    options = {**_env_options(), **options}
+    if city:
+        tenants_env = os.getenv("TENANTS_DATA_DIR")
+        db_root = Path(os.getenv("VECTOR_DB_DIR") or DEFAULT_DB_DIR)
+        tenants_dir = Path(tenants_env) if tenants_env else DEFAULT_TENANTS_DIR
+        data_dir = data_dir or tenants_dir / city
+        db_dir = db_dir or db_root / city
+        return ingest(data_dir, db_dir, **options)
     data_env = os.getenv("DATA_DIR")
     db_env = os.getenv("VECTOR_DB_DIR")
     data_dir = Path(data_env) if data_env else data_dir or DEFAULT_DATA_DIR
     db_dir = Path(db_env) if db_env else db_dir or DEFAULT_DB_DIR
-    ingest(data_dir, db_dir)
+    return ingest(data_dir, db_dir, **options)
 
 
 def _cli() -> None:
@@ -71,13 +404,53 @@ def _cli() -> None:
         description="Ingest documents into a Chroma vector store"
     )
     parser.add_argument(
-        "--data-dir", type=Path, help="Directory of text files", default=None
+        "--data-dir", type=Path, help="Directory of documents", default=None
     )
     parser.add_argument(
         "--db-dir", type=Path, help="Destination for the vector DB", default=None
     )
+    parser.add_argument(
+        "--city",
+        help="Tenant name; reads data/<city>/ and writes <db-dir>/<city>/",
+        default=None,
+    )
+    parser.add_argument(
+        "--chunker",
+        choices=["sections", "recursive"],
+        help="Split on section boundaries or purely by size",
+    )
+    parser.add_argument("--chunk-size", type=int, help="Maximum chunk length")
+    parser.add_argument("--chunk-overlap", type=int, help="Overlap between chunks")
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        help="MinHash similarity above which chunks are dropped (0 disables)",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Processes extracting HTML, PDF and DOCX files"
+    )
+    parser.add_argument(
+        "--extract-timeout", type=float, help="Seconds allowed to extract one file"
+    )
+    parser.add_argument(
+        "--extract-memory-mb", type=int, help="Memory allowed to extract one file"
+    )
     args = parser.parse_args()
-    main(args.data_dir, args.db_dir)
+    options = {
+        key: value
+        for key, value in {
+            "chunker": args.chunker,
+            "chunk_size": args.chunk_size,
+            "chunk_overlap": args.chunk_overlap,
+            "dedup_threshold": args.dedup_threshold,
+            "workers": args.workers,
+            "extract_timeout": args.extract_timeout,
+            "extract_memory_mb": args.extract_memory_mb,
+        }.items()
+        if value is not None
+    }
+    report = main(args.data_dir, args.db_dir, args.city, **options)
+    print(json.dumps(report))
 
 
 if __name__ == "__main__":
@@ -278,3 +278,925 @@ async def test_chat_engine_concurrent():
 
     r1, r2 = await asyncio.gather(call(), call())
     assert r1 and r2
+
+
+def test_merge_chunks_stitches_overlap():
+    from api.context import merge_chunks
+
+    class Doc:
+        def __init__(self, text: str, source: str | None = None) -> None:
+            self.page_content = text
+            self.metadata = {"source": source} if source else {}
+
+    first = "Trash is collected weekly on Monday. Recycling bins go out every other week."
+    second = "Recycling bins go out every other week. Green waste is collected on Fridays."
+    merged = merge_chunks([Doc(second, "a.txt"), Doc(first, "a.txt"), Doc(first, "b.txt")])
+    assert merged[0] == (
+        "Trash is collected weekly on Monday. Recycling bins go out every other "
+        "week. Green waste is collected on Fridays."
+    )
+    assert len(merged) == 2
+
+
+def test_pack_context_drops_duplicates_and_respects_budget():
+    from api.context import estimate_tokens, pack_context
+
+    class Doc:
+        def __init__(self, text: str) -> None:
+            self.page_content = text
+
+    a = "Fence permits are required for fences over 3.5 feet in the front yard."
+    b = "Fence permits are required for fences over 3.5 feet in the front yard!"
+    c = " ".join(["word"] * 200)
+    context = pack_context([Doc(a), Doc(b), Doc(c)], budget=50)
+    assert context == a
+    assert estimate_tokens(pack_context([Doc(c)], budget=20)) <= 20
+
+
+def test_vector_store_registry_lru_eviction():
+    from api.tenants import VectorStoreRegistry
+
+    loads = []
+
+    def loader(city):
+        loads.append(city)
+        return f"store-{city}"
+
+    registry = VectorStoreRegistry(loader, max_stores=2)
+    assert registry.get("a") == "store-a"
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+    assert "b" not in registry
+    assert "a" in registry and "c" in registry
+    registry.get("a")
+    assert loads == ["a", "b", "c"]
+    registry.evict("a")
+    registry.get("a")
+    assert loads[-1] == "a"
+
+
+def test_vector_store_registry_keeps_missing_stores_out_of_lru():
+    import threading
+    from api.tenants import VectorStoreRegistry
+
+    loads = []
+    slow_started = threading.Event()
+    release = threading.Event()
+
+    def loader(city):
+        loads.append(city)
+        if city == "slow":
+            slow_started.set()
+            release.wait(5)
+        return None if city.startswith("typo") else f"store-{city}"
+
+    registry = VectorStoreRegistry(loader, max_stores=2)
+    registry.get("goleta")
+    assert registry.get("typo1") is None and registry.get("typo2") is None
+    assert registry.try_get("typo1") == (True, None)
+    assert "goleta" in registry and len(registry) == 1
+    registry.get("typo1")
+    assert loads == ["goleta", "typo1", "typo2"]
+
+    # A cold load holds only its own city's lock.
+    slow = threading.Thread(target=registry.get, args=("slow",))
+    slow.start()
+    assert slow_started.wait(5)
+    assert registry.try_get("goleta") == (True, "store-goleta")
+    assert registry.get("ventura") == "store-ventura"
+    release.set()
+    slow.join(5)
+    assert registry.get("slow") == "store-slow" and loads.count("slow") == 1
+
+
+def test_vector_store_registry_releases_evicted_chroma_systems(monkeypatch, tmp_path):
+    from chromadb.api.client import SharedSystemClient
+    from langchain_community.embeddings import FakeEmbeddings
+    from api.tenants import VectorStoreRegistry
+
+    monkeypatch.setattr(app_mod, "get_embeddings", lambda: FakeEmbeddings(size=4))
+    monkeypatch.setattr(app_mod.settings, "shared_index", False)
+    for city in ("goleta", "ventura"):
+        (tmp_path / city).mkdir()
+    registry = VectorStoreRegistry(
+        lambda city: app_mod.load_vectordb(tmp_path / city),
+        max_stores=1,
+        unload=app_mod.close_vectordb,
+    )
+    systems = SharedSystemClient._identifer_to_system
+    goleta = registry.get("goleta")
+    goleta.add_texts(["Trash goes out Monday."])
+    assert str(tmp_path / "goleta") in systems
+    registry.get("ventura")
+    assert str(tmp_path / "goleta") not in systems
+    assert str(tmp_path / "ventura") in systems
+    registry.evict("ventura")
+    assert str(tmp_path / "ventura") not in systems
+    assert registry.get("goleta").similarity_search("trash", k=1)
+
+
+def test_chat_unknown_city_returns_404(monkeypatch, tmp_path):
+    import api.tenants as tenants
+
+    monkeypatch.setattr(tenants.settings, "vector_db_dir", tmp_path)
+    monkeypatch.setattr(app_mod.settings, "max_message_bytes", 4000)
+    resp = TestClient(app_mod.app).post("/chat", json={"message": "hi", "city": "nowhere"})
+    assert resp.status_code == 404
+    assert "nowhere" not in app_mod.app.state.stores
+
+
+def test_tenant_paths_rejects_traversal():
+    from api.tenants import tenant_paths
+
+    data_dir, db_dir = tenant_paths("goleta")
+    assert data_dir.name == "goleta" and db_dir.name == "goleta"
+    with pytest.raises(ValueError):
+        tenant_paths("../etc")
+
+
+def test_chat_rejects_invalid_city():
+    resp = client.post("/chat", json={"message": "hi", "city": "../x"})
+    assert resp.status_code == 422
+
+
+def test_vector_store_registry_reloads_new_generation():
+    from api.tenants import VectorStoreRegistry
+
+    generation = {"value": 1}
+    registry = VectorStoreRegistry(
+        lambda city: f"store-{generation['value']}",
+        version=lambda city: generation["value"],
+        check_interval=0.0,
+    )
+    assert registry.try_get(None) == (False, None)
+    assert registry.get(None) == "store-1"
+    assert registry.try_get(None) == (True, "store-1")
+    generation["value"] = 2
+    assert registry.try_get(None) == (False, None)
+    assert registry.get(None) == "store-2"
+
+
+def test_vector_store_registry_reloads_chroma_ingested_elsewhere(monkeypatch, tmp_path):
+    import subprocess
+    import sys
+    from langchain_community.embeddings import FakeEmbeddings
+    from api.tenants import VectorStoreRegistry
+    from api.vector_index import read_generation
+
+    monkeypatch.setattr(app_mod, "get_embeddings", lambda: FakeEmbeddings(size=4))
+    monkeypatch.setattr(app_mod.settings, "shared_index", False)
+    registry = VectorStoreRegistry(
+        lambda city: app_mod.load_vectordb(tmp_path),
+        version=lambda city: read_generation(tmp_path),
+        check_interval=0.0,
+        unload=app_mod.close_vectordb,
+    )
+    registry.get(None).add_texts(["Trash goes out Monday."], ids=["0"])
+    assert len(registry.get(None).similarity_search("trash", k=2)) == 1
+
+    # Another worker (or the CLI) ingests into the same directory.
+    script = (
+        "import chromadb, sys; "
+        "chromadb.PersistentClient(path=sys.argv[1]).get_collection('langchain').add("
+        "ids=['1'], embeddings=[[0.1, 0.2, 0.3, 0.4]], documents=['Fences need permits.'])"
+    )
+    subprocess.run([sys.executable, "-c", script, str(tmp_path)], check=True)
+    (tmp_path / "GENERATION").write_text("1")
+    assert len(registry.get(None).similarity_search("trash", k=2)) == 2
+
+
+def test_session_store_summarizes_and_bounds_history():
+    from api.sessions import SessionStore
+
+    store = SessionStore(max_turns=2, summary_tokens=20)
+    session = store.get(store.create())
+    for i in range(5):
+        store.append(session, True, f"Question {i} about trash pickup. More detail.")
+        store.append(session, False, f"Answer {i} is Monday.")
+    assert len(session.turns) == 2
+    assert session.summary[-1] == "A: Answer 3 is Monday."
+    assert "More detail" not in " ".join(session.summary)
+    history = session.history()
+    assert history.startswith("Earlier: ") and history.endswith("Answer 4 is Monday.")
+
+
+def test_session_store_lru_and_ttl(monkeypatch):
+    import api.sessions as sessions
+
+    now = {"t": 0.0}
+    monkeypatch.setattr(sessions.time, "monotonic", lambda: now["t"])
+    store = sessions.SessionStore(ttl=10.0, max_sessions=2)
+    a = store.create()
+    b = store.create()
+    store.get(a)
+    store.create()
+    assert store.get(b) is None and store.get(a) is not None
+    now["t"] = 11.0
+    assert store.get(a) is None and len(store) == 0
+
+
+def test_condense_query_uses_previous_question():
+    from api.sessions import SessionStore, condense_query
+
+    store = SessionStore()
+    session = store.get(store.create())
+    assert condense_query(session, "what about on holidays?") == "what about on holidays?"
+    store.append(session, True, "When is trash collected?")
+    store.append(session, False, "Mondays.")
+    assert condense_query(session, "what about on holidays?") == (
+        "When is trash collected? what about on holidays?"
+    )
+    standalone = "Do I need a permit for a fence taller than eight feet in my backyard?"
+    assert condense_query(session, standalone) == standalone
+    standalone = (
+        "Is there a permit required for building a backyard fence taller than eight feet?"
+    )
+    assert condense_query(session, standalone) == standalone
+    assert condense_query(session, "Is it also picked up on the Monday after Christmas?") == (
+        "When is trash collected? Is it also picked up on the Monday after Christmas?"
+    )
+
+
+def test_session_memory_per_thousand_sessions():
+    import tracemalloc
+    from api.sessions import SessionStore
+
+    store = SessionStore(max_turns=6)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(1000):
+        session = store.get(store.create())
+        for i in range(10):
+            store.append(session, True, f"When is the trash pickup on street {i}?")
+            store.append(session, False, f"Trash on street {i} is collected Monday.")
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert used < 4 * 1024 * 1024
+
+
+def test_chat_unknown_session_returns_404():
+    resp = client.post("/sessions")
+    assert resp.status_code == 200 and resp.json()["session_id"]
+    resp = client.post("/chat", json={"message": "hi", "session_id": "nope"})
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_run_batch_streams_results_and_isolates_errors():
+    import asyncio
+    from api.batch import iter_jsonl, run_batch
+
+    async def body():
+        yield b'{"id": "a", "message": "one"}\n{"message": "two"}\nnot json\n'
+        yield b'{"id": "d", "message": "boom"}\n{"id": "e", "message": "ok", "error": "x"}'
+
+    prepared = []
+
+    async def prepare(group):
+        prepared.append([item["message"] for item in group])
+        return [item["message"] for item in group]
+
+    async def generate(prompt):
+        await asyncio.sleep(0)
+        if prompt == "boom":
+            raise RuntimeError("llm down")
+        return prompt.upper()
+
+    results = [
+        r async for r in run_batch(iter_jsonl(body()), prepare, generate, batch_size=2)
+    ]
+    by_id = {r["id"]: r for r in results}
+    assert by_id["a"] == {"id": "a", "response": "ONE"}
+    assert by_id[1] == {"id": 1, "response": "TWO"}
+    assert by_id[2]["error"] == "invalid JSON"
+    assert by_id["d"]["error"] == "generation failed"
+    assert by_id["e"] == {"id": "e", "response": "OK"}
+    assert prepared == [["one", "two"], ["boom", "ok"]]
+
+
+@pytest.mark.asyncio
+async def test_run_batch_bounds_concurrency():
+    import asyncio
+    from api.batch import run_batch
+
+    async def items():
+        for i in range(20):
+            yield {"id": i, "message": str(i)}
+
+    async def prepare(group):
+        return [item["message"] for item in group]
+
+    running = {"now": 0, "max": 0}
+
+    async def generate(prompt):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.001)
+        running["now"] -= 1
+        return prompt
+
+    results = [r async for r in run_batch(items(), prepare, generate, concurrency=3)]
+    assert sorted(r["id"] for r in results) == list(range(20))
+    assert running["max"] == 3
+
+
+def test_chat_batch_streams_jsonl(monkeypatch):
+    import json
+
+    class FakeEngine:
+        async def generate_async(self, prompt, timeout=30.0):
+            return f"answer: {prompt}"
+
+    monkeypatch.setattr(app_mod.settings, "max_message_bytes", 4000)
+    monkeypatch.setattr(app_mod.app.state, "engine", FakeEngine(), raising=False)
+    batch_client = TestClient(app_mod.app)
+    resp = batch_client.post(
+        "/chat_batch",
+        content=(
+            b'{"id": "q1", "message": "trash day?"}\n{"city": "x"}\n'
+            b'{"id": "s", "message": "hi", "session_id": "abc"}\n'
+        ),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert resp.status_code == 200
+    results = {r["id"]: r for r in map(json.loads, resp.text.splitlines())}
+    assert results["q1"]["response"] == "answer: trash day?"
+    assert "error" in results[1]
+    assert results["s"] == {"id": "s", "error": "session_id is not supported in batches"}
+
+
+@pytest.mark.parametrize("ndjson", [False, True])
+def test_chat_batch_stops_when_client_disconnects(monkeypatch, ndjson):
+    import asyncio
+    import json
+
+    calls = []
+
+    class SlowEngine:
+        async def generate_async(self, prompt, timeout=30.0):
+            calls.append(prompt)
+            await asyncio.sleep(0.01)
+            return "ok"
+
+    monkeypatch.setattr(app_mod.settings, "max_message_bytes", 4000)
+    monkeypatch.setattr(app_mod.settings, "batch_concurrency", 2)
+    monkeypatch.setattr(app_mod.app.state, "engine", SlowEngine(), raising=False)
+    monkeypatch.setattr(app_mod.app.state.stores, "try_get", lambda city: (True, None))
+    items = [{"id": i, "message": f"question {i}"} for i in range(200)]
+    if ndjson:
+        body = "".join(json.dumps(item) + "\n" for item in items).encode()
+        content_type = b"application/x-ndjson"
+    else:
+        body = json.dumps({"items": items}).encode()
+        content_type = b"application/json"
+
+    async def scenario():
+        gone = asyncio.Event()
+        sent = []
+
+        async def receive():
+            if not sent:
+                sent.append("body")
+                return {"type": "http.request", "body": body, "more_body": False}
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                gone.set()  # the client hangs up after the first result
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/chat_batch",
+            "raw_path": b"/chat_batch",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"content-type", content_type)],
+            "server": ("testserver", 80),
+            "client": ("testclient", 50000),
+        }
+        await asyncio.wait_for(app_mod.app(scope, receive, send), 2)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert 0 < len(calls) < 20
+
+
+def test_json_log_records_carry_request_id_and_sampling():
+    import json
+    import logging
+    import api.logging_utils as lu
+
+    records = []
+    lu.setup_logging("INFO", fmt="json", use_queue=True, sample_rate=0.0)
+    # Runs after the request filter; collects what would have been queued.
+    logging.getLogger().handlers[0].addFilter(lambda r: records.append(r) and False)
+    log = logging.getLogger("civicai.test")
+    try:
+        token = lu.start_request("req-1")
+        lu.record_timing("retrieve", 1.5)
+        log.info("dropped")
+        log.warning("kept", extra={"timings": lu.current_timings()})
+        assert not lu.token_logging(log)
+        lu.end_request(token)
+    finally:
+        lu.setup_logging("INFO")
+    assert [r.getMessage() for r in records] == ["kept"]
+    payload = json.loads(lu.JsonFormatter().format(records[0]))
+    assert payload["request_id"] == "req-1"
+    assert payload["timings"] == {"retrieve": 1.5}
+
+
+def test_queued_log_records_are_bounded_and_detached():
+    import logging
+    import queue
+    import api.logging_utils as lu
+
+    records: queue.Queue = queue.Queue(2)
+    handler = lu._BoundedQueueHandler(records)
+    log = logging.getLogger("civicai.test.queue")
+    log.addHandler(handler)
+    log.propagate = False
+    try:
+        try:
+            raise ValueError("bad page")
+        except ValueError:
+            log.exception("scrape of %s failed", "https://example.org")
+        log.warning("second")
+        log.warning("third")
+    finally:
+        log.removeHandler(handler)
+        log.propagate = True
+    assert handler.dropped == 1
+    first = records.get_nowait()
+    assert first.msg == "scrape of https://example.org failed" and first.args is None
+    assert first.exc_info is None and "ValueError: bad page" in first.exc_text
+    text = logging.Formatter().format(first)
+    assert text.startswith("scrape of https://example.org failed\nTraceback")
+    assert '"exc": "Traceback' in lu.JsonFormatter().format(first)
+
+
+def test_request_id_header_round_trip():
+    resp = client.get("/health", headers={"X-Request-ID": "abc-123"})
+    assert resp.headers["x-request-id"] == "abc-123"
+    generated = client.get("/health", headers={"X-Request-ID": "bad id!"})
+    assert generated.headers["x-request-id"] not in ("", "bad id!")
+
+
+def test_infer_filter_and_citations():
+    from api.filters import citations, infer_filter, to_chroma
+
+    assert infer_filter("When is trash pickup?") == {"category": "trash"}
+    assert infer_filter("Do I need a permit for a fence?") == {"category": "permits"}
+    assert infer_filter("What is the weather like?") is None
+    assert to_chroma({"category": "trash", "source": "a.txt"}) == {
+        "$and": [{"category": "trash"}, {"source": "a.txt"}]
+    }
+
+    class Doc:
+        def __init__(self, source, section=""):
+            self.metadata = {"source": source, "section": section}
+
+    cited = citations([Doc("a.txt", "Sec. 1"), Doc("a.txt", "Sec. 1"), Doc("b.txt")])
+    assert [(c["source"], c["section"]) for c in cited] == [
+        ("a.txt", "Sec. 1"),
+        ("b.txt", ""),
+    ]
+
+
+def test_chat_stream_ndjson_sends_citations_first(monkeypatch):
+    import json
+
+    class Doc:
+        page_content = "Trash goes out Monday."
+        metadata = {"source": "trash_faq.txt", "section": "", "category": "trash"}
+
+    class FakeDB:
+        def __init__(self):
+            self.filters = []
+
+        def similarity_search(self, query, k=4, filter=None):
+            self.filters.append(filter)
+            return [Doc()]
+
+    class FakeEngine:
+        async def stream_async(self, prompt, timeout=30.0):
+            for token in ("Mon", "day"):
+                yield token
+
+    db = FakeDB()
+    monkeypatch.setattr(app_mod.settings, "max_message_bytes", 4000)
+    monkeypatch.setattr(app_mod.settings, "infer_filters", True)
+    monkeypatch.setattr(app_mod.app.state, "engine", FakeEngine(), raising=False)
+    monkeypatch.setattr(app_mod.app.state.stores, "try_get", lambda city: (True, db))
+    resp = TestClient(app_mod.app).post(
+        "/chat_stream",
+        json={"message": "When is trash pickup?"},
+        headers={"Accept": "application/x-ndjson"},
+    )
+    frames = [json.loads(line) for line in resp.text.splitlines()]
+    assert frames[0]["type"] == "citations"
+    assert frames[0]["citations"][0]["source"] == "trash_faq.txt"
+    assert "".join(f["text"] for f in frames if f["type"] == "token") == "Monday"
+    assert frames[-1] == {"type": "done"}
+    assert db.filters == [{"category": "trash"}]
+
+
+def test_embedding_server_requires_authkey(monkeypatch):
+    from api import embeddings
+
+    loaded = []
+    monkeypatch.setattr(embeddings, "load_local_embeddings", lambda: loaded.append(1))
+    with pytest.raises(ValueError):
+        embeddings.serve("127.0.0.1:0", "")
+    with pytest.raises(ValueError):
+        embeddings.RemoteEmbeddings("127.0.0.1:1", "")
+    assert loaded == []
+
+
+def test_lru_cache_and_cached_embeddings(monkeypatch):
+    from api.cache import CachedEmbeddings, LRUCache
+
+    cache = LRUCache(2, ttl=10.0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert "b" not in cache and cache.get("a") == 1
+    monkeypatch.setattr("api.cache.time.monotonic", lambda: 1e12)
+    assert cache.get("a") is None
+
+    calls = []
+
+    class Inner:
+        def embed_query(self, text):
+            calls.append([text])
+            return [1.0]
+
+        def embed_documents(self, texts):
+            calls.append(list(texts))
+            return [[float(len(t))] for t in texts]
+
+    embeddings = CachedEmbeddings(Inner(), 10)
+    embeddings.embed_query("trash day")
+    assert embeddings.embed_documents(["trash day", "fences"]) == [[1.0], [6.0]]
+    embeddings.embed_query("trash day")
+    assert calls == [["trash day"], ["fences"]]
+
+
+def test_traffic_recorder_anonymizes_and_rotates(tmp_path):
+    from fastapi import FastAPI
+    from api.recorder import TrafficLog, TrafficRecorder, anonymize
+    from api.replay import load_records, top_questions
+
+    assert anonymize("/scrape", b'{"url": "https://u:p@x.org/a?token=1"}') == {
+        "url": "https://x.org/a"
+    }
+    inner = FastAPI()
+
+    @inner.post("/chat")
+    async def chat(payload: dict):
+        return {"response": "ok"}
+
+    log = TrafficLog(tmp_path / "traffic.jsonl")
+    recorded = TestClient(TrafficRecorder(inner, log=log))
+    questions = ["When is trash pickup?", "when is  TRASH pickup?", "Email me@x.org"]
+    for message in questions:
+        recorded.post("/chat", json={"message": message, "session_id": None})
+    recorded.post("/chat", json={"message": "what about fridays?", "session_id": "s1"})
+    log.close()
+    records = load_records([tmp_path / "traffic.jsonl"])
+    assert len(records) == 4
+
+    rotated = TrafficLog(tmp_path / "traffic.jsonl", max_bytes=100, backups=1)
+    rotated.write({"path": "/chat", "body": {"message": "new"}})
+    rotated.close()
+    logs = sorted(tmp_path.iterdir())
+    assert [p.name for p in logs] == ["traffic.jsonl", "traffic.jsonl.1"]
+    assert len(load_records(logs[1:])) == 4
+    assert records[2]["body"] == {"message": "Email <email>"}
+    assert records[3]["body"]["session"] is True
+    top = top_questions(records, 1)
+    assert top == [{"message": "When is trash pickup?", "count": 2}]
+
+
+def test_traffic_log_drops_records_it_cannot_write(tmp_path):
+    import time
+    from api.recorder import TrafficLog
+
+    path = tmp_path / "traffic.jsonl"
+    path.mkdir()  # opening it fails
+    log = TrafficLog(path)
+    for i in range(3):
+        log.write({"path": "/chat", "body": {"message": str(i)}})
+    deadline = time.monotonic() + 5
+    while log.dropped < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert log.dropped == 3 and log._thread.is_alive()
+    path.rmdir()
+    log.write({"path": "/chat", "body": {"message": "recovered"}})
+    log.close()
+    assert path.read_text().count("recovered") == 1
+    log.write({"path": "/chat", "body": {"message": "late"}})
+    assert log.dropped == 4 and log._queue.empty()
+
+
+def test_chat_uses_response_cache(monkeypatch, tmp_path):
+    from api.cache import LRUCache
+
+    calls = []
+
+    class FakeEngine:
+        async def generate_async(self, prompt, timeout=30.0):
+            calls.append(prompt)
+            return "Mondays"
+
+    monkeypatch.setattr(app_mod.settings, "max_message_bytes", 4000)
+    monkeypatch.setattr(app_mod.app.state, "engine", FakeEngine(), raising=False)
+    monkeypatch.setattr(app_mod.app.state, "responses", LRUCache(10))
+    monkeypatch.setattr(app_mod.app.state.stores, "try_get", lambda city: (True, None))
+    monkeypatch.setattr(app_mod.app.state.stores, "check_interval", 0.0)
+    import api.tenants as tenants
+
+    monkeypatch.setattr(tenants.settings, "vector_db_dir", tmp_path)
+    cached_client = TestClient(app_mod.app)
+    for message in ("When is trash pickup?", "when is trash  pickup?"):
+        resp = cached_client.post("/chat", json={"message": message})
+        assert resp.json()["response"] == "Mondays"
+    assert len(calls) == 1
+    # Another worker ingested: the cached answer is stale.
+    (tmp_path / "GENERATION").write_text("2")
+    cached_client.post("/chat", json={"message": "When is trash pickup?"})
+    assert len(calls) == 2
+
+
+def test_warm_caches_skips_work_without_caches(monkeypatch):
+    import asyncio
+
+    monkeypatch.setattr(app_mod.app.state, "responses", None, raising=False)
+    monkeypatch.setattr(app_mod.settings, "embedding_cache_size", 0)
+    monkeypatch.setattr(app_mod, "get_embeddings", lambda: pytest.fail("embedded"))
+    questions = [{"message": "When is trash pickup?", "count": 3}]
+    assert asyncio.run(app_mod.warm_caches(app_mod.app, questions)) == 0
+
+
+def test_response_key_reads_generation_once_per_interval(monkeypatch):
+    from api.tenants import VectorStoreRegistry
+
+    monkeypatch.setattr(app_mod.settings, "max_message_bytes", 4000)
+
+    reads = []
+    registry = VectorStoreRegistry(
+        lambda city: None, version=lambda city: reads.append(city) or 7, check_interval=60.0
+    )
+
+    class App:
+        class state:
+            stores = registry
+
+    req = app_mod.ChatRequest(message="When is trash pickup?")
+    keys = {app_mod.response_key(App, req, None) for _ in range(5)}
+    assert len(keys) == 1 and next(iter(keys))[1] == 7
+    assert reads == [None]
+
+
+def test_warm_caches_embeds_and_searches_without_llm(monkeypatch):
+    import asyncio
+    from api.cache import LRUCache
+
+    searched = []
+
+    class FakeEmbeddings:
+        def embed_documents(self, texts):
+            return [[1.0, 0.0] for _ in texts]
+
+    class FakeDB:
+        embeddings = FakeEmbeddings()
+
+        def similarity_search_by_vector(self, vector, k=4, filter=None):
+            searched.append(filter)
+            return ["Trash goes out Monday."]
+
+    class FakeEngine:
+        async def generate_async(self, prompt, timeout=30.0):
+            pytest.fail("warm-up called the LLM")
+
+    monkeypatch.setattr(app_mod.app.state, "engine", FakeEngine(), raising=False)
+    monkeypatch.setattr(app_mod.app.state, "responses", LRUCache(10), raising=False)
+    monkeypatch.setattr(app_mod.app.state.stores, "try_get", lambda city: (True, FakeDB()))
+    monkeypatch.setattr(app_mod.settings, "embedding_cache_size", 100)
+    monkeypatch.setattr(app_mod.settings, "warmup_answers", False)
+    monkeypatch.setattr(app_mod.settings, "max_message_bytes", 4000)
+    questions = [
+        {"message": "When is trash pickup?", "count": 3},
+        {"message": "Do fences need a permit?", "category": "permits", "count": 2},
+    ]
+    assert asyncio.run(app_mod.warm_caches(app_mod.app, questions)) == 2
+    assert sorted(map(str, searched)) == ["None", "{'category': 'permits'}"]
+    assert len(app_mod.app.state.responses) == 0
+
+
+def test_coalesce_frames_keeps_stream_order():
+    from api.channel import coalesce_frames
+
+    frames = [
+        {"type": "token", "id": "a", "text": "Hel"},
+        {"type": "token", "id": "b", "text": "Yes"},
+        {"type": "token", "id": "a", "text": "lo"},
+        {"type": "done", "id": "a"},
+        {"type": "token", "id": "b", "text": "!"},
+    ]
+    assert coalesce_frames(frames) == [
+        {"type": "token", "id": "a", "text": "Hello"},
+        {"type": "done", "id": "a"},
+        {"type": "token", "id": "b", "text": "Yes!"},
+    ]
+
+
+def test_chat_channel_backpressure_and_cancel():
+    import asyncio
+    import json
+    from api.channel import ChatChannel
+
+    async def scenario():
+        produced = {"slow": 0}
+        sent = []
+        inbox: asyncio.Queue = asyncio.Queue()
+        release = asyncio.Event()
+
+        async def send_text(text):
+            await release.wait()
+            await asyncio.sleep(0.002)  # a slow reader
+            sent.append(json.loads(text))
+
+        async def open_stream(frame):
+            async def tokens():
+                for i in range(100):
+                    produced[frame["id"]] = i + 1
+                    yield "x"
+                    await asyncio.sleep(0)
+
+            return [], tokens()
+
+        channel = ChatChannel(send_text, inbox.get, open_stream, queue_size=4, coalesce=0)
+        runner = asyncio.create_task(channel.run())
+        await inbox.put(json.dumps({"type": "chat", "id": "slow", "message": "hi"}))
+        await asyncio.sleep(0.05)
+        # The client is not reading: production stops at the queue bound.
+        assert produced["slow"] <= 6
+        await inbox.put(json.dumps({"type": "cancel", "id": "slow"}))
+        await inbox.put(json.dumps({"type": "chat", "id": "fast", "message": "hi"}))
+        release.set()
+        await asyncio.sleep(0.5)
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        return sent
+
+    sent = asyncio.run(scenario())
+    kinds = [(f["id"], f["type"]) for f in sent]
+    assert ("slow", "cancelled") in kinds and ("slow", "done") not in kinds
+    assert kinds[-1] == ("fast", "done")
+    text = "".join(f["text"] for f in sent if f["id"] == "fast" and f["type"] == "token")
+    assert text == "x" * 100
+    assert sum(1 for f in sent if f["type"] == "token") < 100
+
+
+def test_chat_channel_closes_when_client_never_reads_errors():
+    import asyncio
+    from api.channel import ChatChannel
+
+    async def scenario():
+        inbox: asyncio.Queue = asyncio.Queue()
+        closed = []
+
+        async def send_text(text):
+            await asyncio.Event().wait()  # the client never reads
+
+        async def open_stream(frame):
+            raise AssertionError("no chat frame was sent")
+
+        async def close(code):
+            closed.append(code)
+
+        channel = ChatChannel(
+            send_text,
+            inbox.get,
+            open_stream,
+            queue_size=1,
+            coalesce=0,
+            send_timeout=0.1,
+            close=close,
+        )
+        for _ in range(10):
+            inbox.put_nowait("not json")
+        await asyncio.wait_for(channel.run(), 2)
+        return closed, inbox.qsize()
+
+    closed, unread = asyncio.run(scenario())
+    assert closed == [1008]
+    assert unread > 0
+
+
+def test_stalled_websocket_reader_frees_engine(monkeypatch):
+    import asyncio
+    import json
+    import time
+    import httpx
+
+    class LockedEngine:
+        """Holds one slot for the whole stream, like ``ChatEngine``."""
+
+        def __init__(self):
+            self._lock = asyncio.Lock()
+
+        async def stream_async(self, prompt, timeout=30.0):
+            async with self._lock:
+                while True:
+                    yield "token "
+                    await asyncio.sleep(0)
+
+        async def generate_async(self, prompt, timeout=30.0):
+            async with self._lock:
+                return "Trash goes out on Monday."
+
+    monkeypatch.setattr(app_mod.settings, "max_message_bytes", 4000)
+    monkeypatch.setattr(app_mod.settings, "ws_send_queue", 2)
+    monkeypatch.setattr(app_mod.settings, "ws_coalesce_ms", 0.0)
+    monkeypatch.setattr(app_mod.settings, "ws_send_timeout", 0.2)
+    monkeypatch.setattr(app_mod.app.state, "responses", None, raising=False)
+    monkeypatch.setattr(app_mod.app.state.stores, "try_get", lambda city: (True, None))
+
+    async def scenario():
+        app_mod.app.state.engine = LockedEngine()
+        inbox: asyncio.Queue = asyncio.Queue()
+        inbox.put_nowait({"type": "websocket.connect"})
+        frame = {"type": "chat", "id": 1, "message": "tell me everything"}
+        inbox.put_nowait({"type": "websocket.receive", "text": json.dumps(frame)})
+
+        async def send(message):
+            if message["type"] != "websocket.accept":
+                await asyncio.Event().wait()  # the client never reads
+
+        scope = {
+            "type": "websocket",
+            "path": "/ws",
+            "raw_path": b"/ws",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [],
+            "scheme": "ws",
+            "server": ("testserver", 80),
+            "client": ("testclient", 50000),
+            "subprotocols": [],
+            "asgi": {"version": "3.0"},
+        }
+        ws = asyncio.create_task(app_mod.app(scope, inbox.get, send))
+        await asyncio.sleep(0.05)
+        transport = httpx.ASGITransport(app=app_mod.app)
+        start = time.monotonic()
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            resp = await asyncio.wait_for(
+                http.post("/chat", json={"message": "trash day?"}), 5
+            )
+        elapsed = time.monotonic() - start
+        ws.cancel()
+        await asyncio.gather(ws, return_exceptions=True)
+        return resp, elapsed
+
+    monkeypatch.setattr(app_mod.app.state, "engine", None, raising=False)
+    resp, elapsed = asyncio.run(scenario())
+    assert resp.status_code == 200
+    assert resp.json()["response"] == "Trash goes out on Monday."
+    assert elapsed < 2
+
+
+def test_websocket_multiplexes_messages(monkeypatch):
+    class FakeEngine:
+        async def stream_async(self, prompt, timeout=30.0):
+            for token in ("On ", "Monday"):
+                yield token
+
+    monkeypatch.setattr(app_mod.settings, "max_message_bytes", 4000)
+    monkeypatch.setattr(app_mod.app.state, "engine", FakeEngine(), raising=False)
+    monkeypatch.setattr(app_mod.app.state.stores, "try_get", lambda city: (True, None))
+    with TestClient(app_mod.app).websocket_connect("/ws") as ws:
+        ws.send_json({"type": "chat", "id": 1, "message": "trash day?"})
+        ws.send_json({"type": "chat", "id": 2, "message": "x" * 5000})
+        ws.send_json({"type": "chat", "id": 3, "message": "recycling day?"})
+        replies: dict = {}
+        done = set()
+        while len(done) < 3:
+            frame = ws.receive_json()
+            replies.setdefault(frame["id"], []).append(frame)
+            if frame["type"] in ("done", "error"):
+                done.add(frame["id"])
+    for stream_id in (1, 3):
+        frames = replies[stream_id]
+        assert frames[0]["type"] == "citations"
+        assert "".join(f.get("text", "") for f in frames) == "On Monday"
+    assert replies[2] == [{"type": "error", "id": 2, "detail": "Value error, message too long"}]
@@ -0,0 +1,385 @@
+from data.ingest import export_shared_index
+from api.vector_index import SharedIndex, read_generation
+
+
+class FakeStore:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get(self, include=None):
+        return {
+            "embeddings": [r[0] for r in self.rows],
+            "documents": [r[1] for r in self.rows],
+            "metadatas": [r[2] for r in self.rows],
+        }
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, 0.0] if "trash" in text else [0.0, 1.0]
+
+
+def test_export_shared_index_roundtrip(tmp_path):
+    store = FakeStore(
+        [
+            ([2.0, 0.1], "Trash goes out Monday.", {"source": "trash_faq.txt"}),
+            ([0.1, 3.0], "Fence permits over 3.5 feet.", None),
+        ]
+    )
+    assert read_generation(tmp_path) == 0
+    assert export_shared_index(store, tmp_path) == 1
+    index = SharedIndex.load(tmp_path, FakeEmbeddings())
+    assert len(index) == 2
+    docs = index.similarity_search("when is trash pickup", k=1)
+    assert docs[0].page_content == "Trash goes out Monday."
+    assert docs[0].metadata == {"source": "trash_faq.txt"}
+    assert index.similarity_search("fence", k=5)[0].metadata == {}
+
+
+def test_export_shared_index_bumps_generation(tmp_path):
+    store = FakeStore([([1.0, 0.0], "a", {})])
+    for _ in range(3):
+        generation = export_shared_index(store, tmp_path)
+    assert generation == 3 and read_generation(tmp_path) == 3
+    kept = sorted(p.name for p in (tmp_path / "shared_index").iterdir())
+    assert kept == ["2", "3"]
+
+
+MINUTES = """CITY OF SANTA BARBARA
+REGULAR MEETING AGENDA
+Sec. 28.04.010 Definitions.
+A fence is any structure forming a barrier along a lot line.
+Sec. 28.04.020 Height limits.
+Fences in the front yard may not exceed 3.5 feet in height.
+Item 4 Public comment
+Members of the public may address the Council on any item.
+"""
+
+NOTICE = (
+    "In compliance with the Americans with Disabilities Act, if you need "
+    "special assistance to participate in this meeting, please contact the "
+    "City Clerk's Office at least 48 hours prior to the meeting."
+)
+
+
+def test_section_chunker_splits_on_headings():
+    from data.chunking import SectionChunker
+
+    sections = SectionChunker().split_sections(MINUTES)
+    headings = [heading for heading, _ in sections]
+    assert headings == [
+        "Sec. 28.04.010 Definitions.",
+        "Sec. 28.04.020 Height limits.",
+        "Item 4 Public comment",
+    ]
+    assert sections[0][1].startswith("CITY OF SANTA BARBARA\nREGULAR MEETING AGENDA")
+
+
+def test_section_chunker_prefixes_heading_on_long_sections():
+    from data.chunking import SectionChunker
+
+    body = " ".join(f"Sentence {i} about setbacks." for i in range(60))
+    chunks = SectionChunker(chunk_size=200, chunk_overlap=0).split_text(
+        f"Sec. 28.87.062 Setbacks.\n{body}"
+    )
+    assert len(chunks) > 1
+    assert all(chunk.startswith("Sec. 28.87.062 Setbacks.\n") for chunk in chunks)
+    assert all(len(chunk) <= 200 for chunk in chunks)
+
+
+def test_section_chunks_merge_back_into_their_section():
+    from api.context import merge_chunks
+    from data.chunking import SectionChunker
+
+    class Doc:
+        def __init__(self, heading, text):
+            self.page_content = text
+            self.metadata = {"source": "fences.txt", "section": heading}
+
+    body = " ".join(
+        f"Fences in zone {i} may not exceed {i % 7 + 2} feet along the front lot line."
+        for i in range(30)
+    )
+    text = f"CITY OF SANTA BARBARA\nSec. 28.87.170 Fences.\n{body}"
+    pieces = SectionChunker(chunk_size=500, chunk_overlap=50).split_with_headings(text)
+    assert len(pieces) > 2
+    assert all(len(chunk) <= 500 for _heading, chunk in pieces)
+    assert merge_chunks([Doc(heading, chunk) for heading, chunk in pieces]) == [text]
+
+
+def test_near_duplicate_filter_drops_boilerplate():
+    from data.chunking import NearDuplicateFilter
+
+    chunks = [
+        NOTICE,
+        "Trash is collected weekly on Mondays in the downtown district.",
+        NOTICE + " Thank you.",
+        NOTICE,
+        "Fence permits are required for fences over 8 feet anywhere on a lot.",
+    ]
+    kept, stats = NearDuplicateFilter().filter(chunks)
+    assert kept == [chunks[0], chunks[1], chunks[4]]
+    assert stats.chunks_in == 5 and stats.chunks_out == 3
+    assert 0.5 < stats.reduction < 1.0
+
+
+def test_chunk_documents_reports_reduction():
+    from data.ingest import chunk_documents
+
+    documents = [
+        f"Item {i} Council update\nUpdate {i}.\nNOTICE TO THE PUBLIC\n{NOTICE}"
+        for i in range(5)
+    ]
+    chunks, report = chunk_documents(documents)
+    assert report["documents"] == 5
+    assert report["duplicates"] == 4
+    assert report["chunks"] == len(chunks)
+    assert report["reduction"] > 0.3
+
+
+def test_quantize_int8_roundtrip():
+    import numpy as np
+    from data.ingest import quantize_int8
+
+    vectors = np.array([[0.6, -0.8, 0.0], [0.0, 0.0, 0.0]], dtype=np.float32)
+    codes, scales = quantize_int8(vectors)
+    assert codes.dtype == np.int8 and codes[0].tolist() == [95, -127, 0]
+    assert np.allclose(codes * scales[:, None], vectors, atol=0.01)
+
+
+def test_quantized_shared_index_matches_float32(tmp_path):
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    rows = [(list(v), f"chunk {i}", {}) for i, v in enumerate(rng.normal(size=(200, 16)))]
+    export_shared_index(FakeStore(rows), tmp_path)
+    queries = rng.normal(size=(10, 16)).astype(np.float32)
+    exact = SharedIndex.load(tmp_path, None).search(queries, 5)
+    for dtype in ("float16", "int8"):
+        index = SharedIndex.load(tmp_path, None, dtype=dtype, rerank=4)
+        assert index.dtype == dtype
+        assert index.nbytes < SharedIndex.load(tmp_path, None).nbytes
+        found = index.search(queries, 5)
+        assert all(np.array_equal(a, b) for a, b in zip(found, exact))
+
+
+def test_evaluate_sweep_reports_metrics(tmp_path):
+    from data.evaluate import sweep
+
+    (tmp_path / "trash.txt").write_text("Trash pickup is every Monday at the curb.")
+    (tmp_path / "permits.txt").write_text("Fence permits are required over 8 feet.")
+    labels = [
+        {"question": "When is trash pickup?", "sources": ["trash.txt"]},
+        {"question": "Do fences need permits?", "sources": ["permits.txt"]},
+    ]
+    rows = sweep(tmp_path, labels, ["recursive"], [100, 20], [0, 50], [1, 2])
+    assert {(r["chunk_size"], r["overlap"]) for r in rows} == {(100, 0), (100, 50), (20, 0)}
+    best = [r for r in rows if r["chunk_size"] == 100 and r["overlap"] == 0 and r["k"] == 1]
+    assert best[0]["recall"] == 1.0 and best[0]["mrr"] == 1.0
+    assert all(r["tokens"] > 0 and r["latency_ms"] >= 0 for r in rows)
+
+
+def test_evaluate_handles_empty_corpus_and_questions():
+    import pytest
+    from data.evaluate import HashingEmbeddings, evaluate
+
+    labels = [{"question": "When is trash pickup?", "sources": ["trash.txt"]}]
+    rows = evaluate([], labels, [1, 3], HashingEmbeddings())
+    assert [(r["k"], r["recall"], r["mrr"], r["tokens"]) for r in rows] == [
+        (1, 0.0, 0.0, 0.0),
+        (3, 0.0, 0.0, 0.0),
+    ]
+    with pytest.raises(ValueError, match="no labeled questions"):
+        evaluate([], [], [1], HashingEmbeddings())
+
+
+def test_split_documents_records_metadata(tmp_path):
+    from data.ingest import document_metadata, split_documents
+
+    path = tmp_path / "council_minutes.txt"
+    path.write_text(MINUTES + "Adopted March 3, 2024.\n")
+    metadata = document_metadata(path, path.read_text())
+    assert metadata == {
+        "source": "council_minutes.txt",
+        "category": "council",
+        "date": "2024-03-03",
+    }
+    chunks, metadatas, _report = split_documents([path.read_text()], [metadata])
+    assert len(chunks) == len(metadatas) == 3
+    assert metadatas[1]["section"] == "Sec. 28.04.020 Height limits."
+    assert all(m["source"] == "council_minutes.txt" for m in metadatas)
+
+
+def test_shared_index_filters_by_metadata(tmp_path):
+    store = FakeStore(
+        [
+            ([1.0, 0.0], "Trash goes out Monday.", {"category": "trash"}),
+            ([0.9, 0.1], "Permit fees are due Monday.", {"category": "permits"}),
+            ([0.0, 1.0], "Fence permits over 3.5 feet.", {"category": "permits"}),
+        ]
+    )
+    export_shared_index(store, tmp_path)
+    for dtype, rerank in [("float32", 0), ("int8", 4)]:
+        index = SharedIndex.load(tmp_path, FakeEmbeddings(), dtype=dtype, rerank=rerank)
+        docs = index.similarity_search("trash", k=2, filter={"category": "permits"})
+        assert [d.page_content for d in docs] == [
+            "Permit fees are due Monday.",
+            "Fence permits over 3.5 feet.",
+        ]
+        assert index.similarity_search("trash", k=2, filter={"category": "x"}) == []
+
+
+def _write_docx(path, paragraphs):
+    import zipfile
+
+    body = "".join(
+        f'<w:p><w:pPr><w:pStyle w:val="{style}"/></w:pPr><w:r><w:t>{text}</w:t></w:r></w:p>'
+        if style
+        else f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>"
+        for style, text in paragraphs
+    )
+    xml = (
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/'
+        f'wordprocessingml/2006/main"><w:body>{body}</w:body></w:document>'
+    )
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("word/document.xml", xml)
+
+
+def test_shared_index_filters_categories_without_decoding_chunks(tmp_path, monkeypatch):
+    import pytest
+
+    store = FakeStore(
+        [
+            ([1.0, 0.0], "Trash goes out Monday.", {"category": "trash", "source": "a"}),
+            ([0.9, 0.1], "Permit fees are due Monday.", {"category": "permits", "source": "b"}),
+            ([0.0, 1.0], "Agenda posted Friday.", {"source": "c"}),
+        ]
+    )
+    generation = export_shared_index(store, tmp_path)
+    index_dir = tmp_path / "shared_index" / str(generation)
+    (index_dir / "legacy").mkdir()
+    for name in ("embeddings.npy", "offsets.npy", "chunks.bin"):
+        (index_dir / "legacy" / name).write_bytes((index_dir / name).read_bytes())
+
+    for directory in (index_dir, index_dir / "legacy"):
+        index = SharedIndex(directory, FakeEmbeddings())
+        monkeypatch.setattr(index, "_record", lambda i: pytest.fail("decoded a chunk"))
+        assert index.matching_rows({"category": "permits"}).tolist() == [1]
+        assert index.matching_rows({"category": {"$in": ["trash", "permits"]}}).tolist() == [0, 1]
+        assert index.matching_rows({"category": {"$eq": "zoning"}}).tolist() == []
+        monkeypatch.undo()
+        assert index.matching_rows({"source": "c"}).tolist() == [2]
+
+
+def test_extract_documents_formats_and_cache(tmp_path):
+    from data.chunking import SectionChunker
+    from data.extract import extract_documents
+    from data.ingest import document_paths
+
+    data_dir = tmp_path / "docs"
+    data_dir.mkdir()
+    (data_dir / "trash_faq.txt").write_text("Trash goes out Monday.")
+    (data_dir / "agenda.html").write_text(
+        "<html><script>x()</script><body><h1>Agenda</h1><h2>Item 1</h2><p>Call to "
+        "<b>order</b></p><div>Item 2<br>Public comment</div></body></html>"
+    )
+    _write_docx(
+        data_dir / "fence_permits.docx",
+        [("Heading2", "Fences"), (None, "Fences over 3.5 feet need a permit.")],
+    )
+    (data_dir / "notes.json").write_text("{}")
+    (data_dir / "broken.docx").write_text("not a zip file")
+    cache = tmp_path / "cache"
+
+    docs, report = extract_documents(document_paths(data_dir), cache_dir=cache, workers=2)
+    texts = {path.name: text for path, text in docs}
+    assert sorted(texts) == ["agenda.html", "fence_permits.docx", "trash_faq.txt"]
+    assert texts["agenda.html"] == "Agenda\nItem 1\nCall to order\nItem 2\nPublic comment"
+    sections = SectionChunker(chunk_size=500).split_with_headings(texts["agenda.html"])
+    assert [heading for heading, _ in sections][-2:] == ["Item 1", "Item 2"]
+    assert texts["fence_permits.docx"] == "## Fences\n\nFences over 3.5 feet need a permit."
+    assert report["extracted"] == 2 and report["cached"] == 0
+    assert list(report["failed"]) == ["broken.docx"]
+
+    (data_dir / "agenda.html").unlink()
+    docs, report = extract_documents(document_paths(data_dir), cache_dir=cache, workers=2)
+    assert report["extracted"] == 0 and report["cached"] == 1
+    assert [p.name for p, _ in docs] == ["fence_permits.docx", "trash_faq.txt"]
+    assert len(list(cache.glob("*.txt"))) == 1
+
+
+def test_extract_worker_enforces_timeout(tmp_path, monkeypatch):
+    import time
+
+    from data import extract
+
+    path = tmp_path / "slow.html"
+    path.write_text("<p>slow</p>")
+    monkeypatch.setitem(extract.EXTRACTORS, ".html", lambda p: time.sleep(5) or "")
+    start = time.monotonic()
+    assert extract._extract_worker(path, 0.2) == (None, "timed out after 0.2s")
+    assert time.monotonic() - start < 2
+
+
+def test_run_pool_kills_worker_stuck_past_its_alarm(tmp_path, monkeypatch):
+    import os
+    import time
+
+    import pytest
+
+    from data import extract
+
+    if not hasattr(os, "mkfifo"):
+        pytest.skip("needs a named pipe")
+    stuck = tmp_path / "stuck.html"
+    os.mkfifo(stuck)  # opening a pipe with no writer blocks the worker
+    done = tmp_path / "done.html"
+    done.write_text("<p>Agenda</p>")
+    # Kill 0.5s in, long before the worker's own 30s alarm could fire.
+    monkeypatch.setattr(extract, "_KILL_GRACE", -29.5)
+    start = time.monotonic()
+    results = extract._run_pool([stuck, done], 1, 30.0, 0)
+    assert results == {stuck: (None, "timed out after 30s"), done: ("Agenda", None)}
+    assert time.monotonic() - start < 20
+
+
+def test_export_shared_index_serializes_concurrent_exports(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    store = FakeStore([([1.0, 0.0], "Trash pickup is Monday.", {})])
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        generations = list(pool.map(lambda _: export_shared_index(store, tmp_path), range(4)))
+    assert sorted(generations) == [1, 2, 3, 4]
+    assert read_generation(tmp_path) == 4
+    assert sorted(p.name for p in (tmp_path / "shared_index").iterdir()) == ["3", "4"]
+
+
+def test_ingest_embeds_with_the_shared_model_without_its_cache(tmp_path, monkeypatch):
+    from api.cache import CachedEmbeddings
+    from data import ingest as ingest_mod
+
+    class FakeChroma:
+        def __init__(self, persist_directory, embedding_function):
+            used.append(embedding_function)
+            self.rows = []
+
+        def get(self, include=None):
+            return {"ids": []}
+
+        def add_texts(self, texts, metadatas, ids):
+            self.rows = list(texts)
+
+        def persist(self):
+            pass
+
+    used = []
+    shared = FakeEmbeddings()
+    monkeypatch.setattr(ingest_mod, "get_embeddings", lambda: CachedEmbeddings(shared, 8))
+    monkeypatch.setattr(ingest_mod, "Chroma", FakeChroma)
+    monkeypatch.setattr(ingest_mod, "export_shared_index", lambda db, db_dir: 1)
+    data_dir = tmp_path / "docs"
+    data_dir.mkdir()
+    (data_dir / "trash_faq.txt").write_text("Trash goes out Monday.")
+    report = ingest_mod.ingest(data_dir, tmp_path / "db")
+    assert used == [shared] and report["generation"] == 1